@@ -0,0 +1,99 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Adaptive polling of the ISPRA hydrometric samples.
+#
+# ISPRA samples the hydrometric level every 10 minutes, and publishes each sample some time later (the publish lag).
+# An adaptive poller learns the publish lag from the timestamps of the samples it observes, and schedules the next
+# poll just after the expected arrival of the next sample; if nothing new has arrived yet, it backs off:
+# {
+#   'sampling_period': 600,
+#   'lag': <the estimated publish lag, in seconds>,
+#   'backoff': <the current backoff, in seconds, or None on the first poll after the expected arrival>,
+#   'latest_sample_time': <the time of the latest observed sample, in seconds since the epoch>,
+#   'staleness': <the data staleness, in seconds, as measured on the latest poll>
+# }
+
+import logging
+
+# Creates an adaptive poller.
+#
+# Args:
+# sampling_period: the sampling period (in seconds), defaulting to 10 minutes.
+# lag: the initial estimate of the publish lag (in seconds), defaulting to 1 minute.
+#
+# Returns: the adaptive poller, as a dictionary.
+def create_adaptive_poller(sampling_period=60*10, lag=60):
+
+    return {
+        'sampling_period': sampling_period,
+        'lag': lag,
+        'backoff': None,
+        'latest_sample_time': None,
+        'staleness': None
+    }
+
+# Updates an adaptive poller with the outcome of a poll, and schedules the next one.
+#
+# Args:
+# poller: the adaptive poller.
+# now: the time of the poll, in seconds since the epoch.
+# latest_sample_time: the time of the latest sample got by the poll, in seconds since the epoch (None if unknown).
+#
+# Returns: the time (in seconds) until the next poll.
+def update_adaptive_poller(poller, now, latest_sample_time):
+
+    logger = logging.getLogger(__name__)
+
+    sampling_period = poller['sampling_period']
+    margin = 5
+
+    # Nothing known yet: poll again after a sampling period.
+    if latest_sample_time is None and poller['latest_sample_time'] is None:
+        return sampling_period
+
+    # A new sample: learn the publish lag.
+    if latest_sample_time is not None and (poller['latest_sample_time'] is None or latest_sample_time > poller['latest_sample_time']):
+        observed_lag = now - latest_sample_time
+        if poller['backoff'] is None and poller['latest_sample_time'] is not None:
+            # Arrived before the first poll: the lag could be shorter, so try a bit earlier next time.
+            poller['lag'] = max(min(poller['lag'], observed_lag) * 0.9, margin)
+        else:
+            # Arrived late (or first observed): the lag is at most the observed one.
+            poller['lag'] = min(max(observed_lag, margin), sampling_period)
+        poller['latest_sample_time'] = latest_sample_time
+        poller['backoff'] = None
+
+    # Nothing new: back off, doubling, up to a sampling period.
+    else:
+        poller['backoff'] = min(2 * poller['backoff'], sampling_period) if poller['backoff'] else 30
+
+    poller['staleness'] = now - poller['latest_sample_time']
+
+    # Poll just after the expected arrival of the next sample, or after the backoff.
+    if poller['backoff'] is None:
+        expected_arrival = poller['latest_sample_time'] + sampling_period + poller['lag']
+        delay = max(expected_arrival - now, 0) + margin
+    else:
+        delay = poller['backoff']
+    logger.debug('Data staleness: ' + str(int(poller['staleness'])) + ' s, publish lag: ' + str(int(poller['lag'])) + ' s, next poll in ' + str(int(delay)) + ' s.')
+
+    return delay
+
+# Gets the data staleness: the time elapsed since the latest observed sample.
+#
+# Args:
+# poller: the adaptive poller.
+# now: the current time, in seconds since the epoch.
+#
+# Returns: the data staleness (in seconds), or None if no sample has been observed yet.
+def get_data_staleness(poller, now):
+
+    if poller['latest_sample_time'] is None:
+        return None
+
+    return now - poller['latest_sample_time']
+
+# --------------------------------------------------
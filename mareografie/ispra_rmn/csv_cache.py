@@ -0,0 +1,242 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Local on-disk cache of the monthly hydrometric distributions (CSV files).
+#
+# Monthly distributions are cached by station and period, like:
+# ~/.mareografie/cache/bari_tide_gauge_rmn_2009/hydrometric.2019-05.csv
+# ~/.mareografie/cache/bari_tide_gauge_rmn_2009/hydrometric.2019-05.json
+# where the JSON file keeps the metadata (URL, ETag, Last-Modified, completeness) of the CSV file.
+#
+# Closed months never change: once downloaded after their end — in UTC, like the ISPRA timestamps, plus a grace period
+# for the samples published late — they are immutable.
+# The current month keeps growing: it is revalidated (ETag, Last-Modified) on each request, asking only for the bytes
+# after the cached ones (HTTP Range) if the cached copy is still valid (If-Range): a changed monthly distribution —
+# rewritten, not only appended to — comes back whole, never spliced onto the cached bytes.
+
+import json
+import logging
+import os
+import re
+import time
+import urllib.error
+from datetime import datetime, timedelta, timezone
+
+from ispra_rmn.http_pool import fetch
+from metrics import increment_counter, timed
+
+# Cache directory (overridden by the MAREOGRAFIE_CACHE_DIRECTORY environment variable, e.g. for benchmarks).
+CACHE_DIRECTORY = os.environ.get('MAREOGRAFIE_CACHE_DIRECTORY', os.path.join(os.path.expanduser('~'), '.mareografie', 'cache'))
+
+# Cache eviction: maximum age (in seconds) of unused entries, and maximum size (in bytes) of the whole cache.
+MAX_AGE = 60*60*24*400
+MAX_SIZE = 64*1024*1024
+
+# Grace period (in seconds) after the end of a month (in UTC) before it is closed, for the samples published late.
+CLOSED_MONTH_GRACE = 60*60*24*3
+
+# Gets the cache key of a station, as a file-system safe name.
+#
+# Args:
+# station: the station, like 'Bari tide gauge (RMN 2009)'.
+#
+# Returns: the cache key of the station, like 'bari_tide_gauge_rmn_2009'.
+def get_station_key(station):
+
+    return re.sub(r'[^a-z0-9]+', '_', station.lower()).strip('_')
+
+# Tells if a monthly period is closed, i.e. it has ended (in UTC) more than CLOSED_MONTH_GRACE seconds ago.
+#
+# Args:
+# period: the monthly period, formatted as '%Y-%m'.
+# now: the current time, as an aware datetime, defaulting to None (now, in UTC).
+#
+# Returns: true if the monthly period is closed.
+def is_closed(period, now=None):
+
+    start = datetime.strptime(period, '%Y-%m').replace(tzinfo=timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+
+    return (now or datetime.now(timezone.utc)) >= end + timedelta(seconds=CLOSED_MONTH_GRACE)
+
+# Gets the paths of a cache entry.
+#
+# Args:
+# station: the station.
+# period: the monthly period, formatted as '%Y-%m'.
+# cache_directory: the cache directory.
+#
+# Returns: the paths of the cached CSV file and of its metadata.
+def get_entry_paths(station, period, cache_directory=CACHE_DIRECTORY):
+
+    directory = os.path.join(cache_directory, get_station_key(station))
+    csv_path = os.path.join(directory, 'hydrometric.' + period + '.csv')
+    metadata_path = os.path.join(directory, 'hydrometric.' + period + '.json')
+
+    return csv_path, metadata_path
+
+# Gets the local path of a monthly distribution, downloading it only if needed.
+#
+# Args:
+# station: the station, like 'Bari tide gauge (RMN 2009)'.
+# period: the monthly period, formatted as '%Y-%m'.
+# url: the URL of the monthly distribution.
+# cache_directory: the cache directory.
+# max_age: the maximum age (in seconds) of unused cache entries.
+# max_size: the maximum size (in bytes) of the whole cache.
+#
+# Returns: the local path of the (cached) monthly distribution.
+def get_cached_csv(station, period, url, cache_directory=CACHE_DIRECTORY, max_age=MAX_AGE, max_size=MAX_SIZE):
+
+    logger = logging.getLogger(__name__)
+
+    csv_path, metadata_path = get_entry_paths(station, period, cache_directory)
+    metadata = read_metadata(metadata_path)
+
+    # A closed month, downloaded after its end, is immutable.
+    if metadata is not None and metadata.get('url') == url and metadata.get('complete') and os.path.exists(csv_path):
+        logger.debug('Cache hit (immutable): ' + csv_path)
+        touch(csv_path, metadata_path)
+        return csv_path
+
+    # Otherwise revalidate the cached monthly distribution, or download it.
+    cached_content = b''
+    if metadata is None or metadata.get('url') != url or not os.path.exists(csv_path):
+        metadata = {'url': url}
+    else:
+        with open(csv_path, 'rb') as csv_file:
+            cached_content = csv_file.read()
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+
+    # Ask only for the bytes after the cached ones, if the cached copy ends with a whole row, and only if it is still
+    # valid (a weak ETag cannot validate a range).
+    if metadata.get('etag') and not metadata['etag'].startswith('W/'):
+        validator = metadata['etag']
+    else:
+        validator = metadata.get('last_modified')
+    if cached_content.endswith(b'\n') and validator:
+        headers['Range'] = 'bytes=' + str(len(cached_content)) + '-'
+        headers['If-Range'] = validator
+
+    complete = is_closed(period)
+    try:
+        with timed('csv_download_seconds'):
+            status, response_headers, content = fetch(url, headers)
+        increment_counter('csv_downloaded_bytes_total', len(content))
+        if status in (304, 416):
+            logger.debug('Cache hit (not modified): ' + csv_path)
+        elif status in (200, 206):
+            metadata['etag'] = response_headers.get('ETag')
+            metadata['last_modified'] = response_headers.get('Last-Modified')
+            if status == 206:
+                logger.debug('Cache hit (appending ' + str(len(content)) + ' bytes): ' + csv_path)
+                content = cached_content + content
+            else:
+                logger.debug('Cache miss: ' + url + ' (' + str(len(content)) + ' bytes)')
+            write_atomically(csv_path, content)
+        else:
+            raise urllib.error.HTTPError(url, status, 'Cannot get the monthly distribution', response_headers, None)
+    except urllib.error.HTTPError:
+        raise
+    except urllib.error.URLError as error:
+        if not os.path.exists(csv_path):
+            raise
+        logger.warning('Cannot revalidate ' + url + ' (' + str(error.reason) + '), using the cached copy.')
+        complete = False
+
+    metadata['complete'] = complete
+    write_atomically(metadata_path, json.dumps(metadata).encode('utf-8'))
+    evict(cache_directory, max_age, max_size)
+
+    return csv_path
+
+# Reads the metadata of a cache entry.
+#
+# Args:
+# metadata_path: the path of the metadata.
+#
+# Returns: the metadata, as a dictionary, or None if missing or unreadable.
+def read_metadata(metadata_path):
+
+    try:
+        with open(metadata_path, 'r') as metadata_file:
+            return json.load(metadata_file)
+    except (OSError, ValueError):
+        return None
+
+# Writes a file atomically, through a temporary file, flushed to disk before replacing the file: after a power loss,
+# the file is either the old one or the new one, never empty or truncated.
+#
+# Args:
+# path: the path of the file.
+# content: the content of the file, as bytes.
+def write_atomically(path, content):
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as temporary_file:
+        temporary_file.write(content)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+
+# Marks the files of a cache entry as recently used, updating their access time only.
+#
+# Args:
+# paths: the paths of the files.
+def touch(*paths):
+
+    for path in paths:
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            pass
+
+# Evicts cache entries by age and size (by their access time): entries unused for more than max_age seconds first,
+# then the least recently used entries, until the cache is smaller than max_size bytes.
+#
+# Args:
+# cache_directory: the cache directory.
+# max_age: the maximum age (in seconds) of unused cache entries.
+# max_size: the maximum size (in bytes) of the whole cache.
+def evict(cache_directory=CACHE_DIRECTORY, max_age=MAX_AGE, max_size=MAX_SIZE):
+
+    logger = logging.getLogger(__name__)
+
+    # Collect the cache entries, as (last use, size, paths of files), from the least recently used.
+    # The files of an entry share the name of its CSV file, like hydrometric.2019-05.csv, hydrometric.2019-05.json, ...
+    entries = []
+    for directory, _, file_names in os.walk(cache_directory):
+        for file_name in file_names:
+            if not file_name.endswith('.csv'):
+                continue
+            prefix = file_name[:-len('csv')]
+            paths = [os.path.join(directory, name) for name in file_names if name.startswith(prefix)]
+            try:
+                last_use = os.stat(os.path.join(directory, file_name)).st_atime
+                size = sum(os.path.getsize(path) for path in paths)
+            except OSError:
+                continue
+            entries.append((last_use, size, paths))
+    entries.sort()
+
+    now = time.time()
+    total_size = sum(size for _, size, _ in entries)
+    for last_use, size, paths in entries:
+        if now - last_use <= max_age and total_size <= max_size:
+            break
+        logger.debug('Evicting ' + paths[0] + '...')
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total_size = total_size - size
+
+# --------------------------------------------------
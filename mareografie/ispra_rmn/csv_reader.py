@@ -0,0 +1,172 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Streaming reader of the monthly hydrometric distributions (CSV files), like:
+# utc;level
+# 2019-05-01 00:00:00;25.0
+# 2019-05-01 00:10:00;22.4
+# ...
+#
+# Rows are read backwards, block by block from the end of the file, and parsed straight into preallocated typed
+# columns — without building a dataframe — so that the latest samples are got without parsing the whole file:
+# reading stops at the first row not newer than a given time, or after a given number of rows.
+# Malformed rows (like the header) are skipped, never raised.
+
+import logging
+import math
+import os
+from datetime import date
+
+import numpy as np
+
+from metrics import timed
+
+# Block size (in bytes) of the backward reads.
+BLOCK_SIZE = 8192
+
+# Minimum size (in bytes) of a valid row: a timestamp, a separator, a one-digit level and a newline.
+MIN_ROW_SIZE = len('2019-05-01 00:00:00;0\n')
+
+# Ordinal of the epoch day.
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Parses a timestamp, like b'2019-05-01 00:10:00'.
+# Dates and times of day repeat across rows (144 samples a day, at the same times each day): both are parsed once,
+# and cached by their text.
+#
+# Args:
+# text: the timestamp, as bytes.
+# parsed: the days since the epoch by date, and the seconds since midnight by time of day (as bytes), cached across calls.
+#
+# Returns: the time, in seconds since the epoch, or None if malformed.
+def parse_utc(text, parsed):
+
+    if len(text) != 19 or text[10:11] not in (b' ', b'T'):
+        return None
+
+    day = parsed.get(text[:10])
+    if day is None:
+        if text[4:5] != b'-' or text[7:8] != b'-':
+            return None
+        try:
+            day = date(int(text[0:4]), int(text[5:7]), int(text[8:10])).toordinal() - EPOCH_ORDINAL
+        except ValueError:
+            return None
+        parsed[text[:10]] = day
+
+    seconds = parsed.get(text[11:])
+    if seconds is None:
+        if text[13:14] != b':' or text[16:17] != b':':
+            return None
+        try:
+            hours, minutes, seconds = int(text[11:13]), int(text[14:16]), int(text[17:19])
+        except ValueError:
+            return None
+        if hours > 23 or minutes > 59 or seconds > 59:
+            return None
+        seconds = parsed[text[11:]] = hours * 3600 + minutes * 60 + seconds
+
+    return day * 86400 + seconds
+
+# Parses a row, like b'2019-05-01 00:10:00;22.4'.
+#
+# Args:
+# line: the row, as bytes.
+# parsed: the parsed dates and times of day, cached across calls (see parse_utc).
+#
+# Returns: the time (in seconds since the epoch) and the level, or None if malformed.
+def parse_row(line, parsed):
+
+    fields = line.split(b';')
+    if len(fields) != 2:
+        return None
+
+    text = fields[0]
+    if len(text) != 19:
+        text = text.strip().strip(b'"')
+    utc = parse_utc(text, parsed)
+    if utc is None:
+        return None
+    try:
+        level = float(fields[1])
+    except ValueError:
+        return None
+    if not math.isfinite(level):
+        return None
+
+    return utc, level
+
+# Reads the rows of a monthly distribution, backwards from its end: all of them, or only the latest ones.
+#
+# Args:
+# path: the path of the monthly distribution.
+# offset: the offset of the first byte to read (at the start of a row), defaulting to 0.
+# newer_than: if not None, the time (in seconds since the epoch) before which reading stops: only the newer rows are read.
+# limit: if not None, the maximum number of (latest) rows to read.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float64) columns, in time order, as NumPy arrays.
+def read_hydrometric_csv(path, offset=0, newer_than=None, limit=None):
+
+    logger = logging.getLogger(__name__)
+
+    parsed = {}
+    with timed('csv_parse_seconds'), open(path, 'rb') as csv_file:
+        position = csv_file.seek(0, os.SEEK_END)
+
+        # Preallocate the columns for the most rows the bytes can hold, and fill them from their end.
+        capacity = max(position - offset, 0) // MIN_ROW_SIZE + 1
+        if limit is not None:
+            capacity = min(capacity, limit)
+        utc = np.empty(capacity, dtype=np.int64)
+        level = np.empty(capacity, dtype=np.float64)
+        start = capacity
+
+        skipped = 0
+        remainder = b''
+        stopped = capacity == 0
+        while position > offset and not stopped:
+            size = min(BLOCK_SIZE, position - offset)
+            position -= size
+            csv_file.seek(position)
+            lines = (csv_file.read(size) + remainder).split(b'\n')
+
+            # The first line of a block may be the end of a row: keep it for the next block, if any.
+            remainder = lines.pop(0) if position > offset else b''
+            for index in range(len(lines) - 1, -1, -1):
+                row = parse_row(lines[index], parsed)
+                if row is None:
+                    # Blank lines, and the header (the first line of the file), are not malformed rows.
+                    if lines[index].strip() and not (position == 0 and index == 0):
+                        skipped += 1
+                    continue
+                if newer_than is not None and row[0] <= newer_than:
+                    stopped = True
+                    break
+                start -= 1
+                utc[start], level[start] = row
+                if start == 0:
+                    stopped = True
+                    break
+
+    if skipped > 0:
+        logger.debug('Skipped ' + str(skipped) + ' malformed rows of ' + path + '.')
+
+    return utc[start:], level[start:]
+
+# Reads the latest sample of a monthly distribution, from its end.
+#
+# Args:
+# path: the path of the monthly distribution.
+#
+# Returns: the time (in seconds since the epoch) and the level of the latest sample, or None if there is none.
+def read_latest_hydrometric_sample(path):
+
+    utc, level = read_hydrometric_csv(path, limit=1)
+    if utc.size == 0:
+        return None
+
+    return int(utc[0]), float(level[0])
+
+# --------------------------------------------------
@@ -0,0 +1,149 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Bounded pool of keep-alive HTTP connections, with timeouts and retries.
+#
+# Requests run on a bounded pool of worker threads: each worker thread keeps its own keep-alive
+# connections, by host, so that consecutive downloads reuse them instead of opening fresh ones.
+
+import http.client
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of concurrent connections (worker threads).
+MAX_CONNECTIONS = 4
+
+# Request timeout (in seconds).
+TIMEOUT = 30
+
+# Retries, and backoff (in seconds, doubling on each retry), on connection failures and server errors.
+RETRIES = 3
+BACKOFF = 0.5
+
+# Maximum number of followed redirections.
+MAX_REDIRECTIONS = 5
+
+# Keep-alive connections of the current thread, by (scheme, network location).
+local = threading.local()
+
+# Worker threads, created on first use, and their number.
+executor = None
+executor_workers = 0
+executor_lock = threading.Lock()
+
+# Gets the pool of worker threads, (re)creating it if MAX_CONNECTIONS changed.
+#
+# Returns: the pool of worker threads, as a concurrent.futures.ThreadPoolExecutor.
+def get_executor():
+
+    global executor, executor_workers
+
+    with executor_lock:
+        if executor is None or executor_workers != MAX_CONNECTIONS:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='http_pool')
+            executor_workers = MAX_CONNECTIONS
+
+    return executor
+
+# Maps a function over an iterable on the pool of worker threads, concurrently.
+#
+# Args:
+# function: the function.
+# iterable: the iterable of arguments.
+#
+# Returns: the list of results, in the order of the iterable.
+def map_concurrently(function, iterable):
+
+    return list(get_executor().map(function, iterable))
+
+# Gets a keep-alive connection of the current thread.
+#
+# Args:
+# scheme: the URL scheme, 'http' or 'https'.
+# netloc: the URL network location, like 'dati.isprambiente.it'.
+# timeout: the request timeout (in seconds).
+#
+# Returns: the connection, as a http.client.HTTPConnection.
+def get_connection(scheme, netloc, timeout):
+
+    connections = getattr(local, 'connections', None)
+    if connections is None:
+        connections = local.connections = {}
+
+    connection = connections.get((scheme, netloc))
+    if connection is None:
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=timeout)
+        connections[(scheme, netloc)] = connection
+    connection.timeout = timeout
+
+    return connection
+
+# Closes and forgets a keep-alive connection of the current thread.
+#
+# Args:
+# scheme: the URL scheme, 'http' or 'https'.
+# netloc: the URL network location.
+def close_connection(scheme, netloc):
+
+    connections = getattr(local, 'connections', {})
+    connection = connections.pop((scheme, netloc), None)
+    if connection is not None:
+        connection.close()
+
+# Gets a URL through a keep-alive connection, retrying with backoff on connection failures and server errors.
+#
+# Args:
+# url: the URL.
+# headers: the request headers, as a dictionary.
+# timeout: the request timeout (in seconds).
+# retries: the number of retries.
+# backoff: the backoff (in seconds) before the first retry, doubling on each retry.
+#
+# Returns: the response status, headers (as a http.client.HTTPMessage), and content (as bytes).
+def fetch(url, headers=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+
+    logger = logging.getLogger(__name__)
+
+    for _ in range(MAX_REDIRECTIONS + 1):
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        for attempt in range(retries + 1):
+            try:
+                connection = get_connection(parts.scheme, parts.netloc, timeout)
+                connection.request('GET', path, headers=headers or {})
+                response = connection.getresponse()
+                content = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    close_connection(parts.scheme, parts.netloc)
+                if response.status < 500 or attempt == retries:
+                    break
+                logger.warning('Server error getting ' + url + ' (' + str(response.status) + '), retrying...')
+            except (OSError, http.client.HTTPException) as error:
+                close_connection(parts.scheme, parts.netloc)
+                if attempt == retries:
+                    raise urllib.error.URLError(error)
+                logger.warning('Cannot get ' + url + ' (' + str(error) + '), retrying...')
+            time.sleep(backoff * 2**attempt)
+
+        if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+            logger.debug('Redirected to ' + url)
+            continue
+
+        return response.status, response.headers, content
+
+    raise urllib.error.URLError('too many redirections')
+
+# --------------------------------------------------
@@ -0,0 +1,309 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Benchmarks for the ISPRA RMN services, without the live ISPRA service: a local HTTP stand-in (see ispra_rmn_stand_in)
+# serves the SPARQL catalogue and the monthly distributions from fixtures — synthetic tides, generated deterministically
+# by period — and the local cache lives in a scratch directory, never in the user's one.
+# Results are printed as text, or as JSON — a list of dictionaries, one per benchmark — to track regressions.
+#
+# Run from the mareografie directory, like:
+# python -m ispra_rmn.ispra_rmn_benchmarks --json
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas
+
+# Cache in a scratch directory: set before importing the ISPRA RMN services, which read it on import.
+os.environ['MAREOGRAFIE_CACHE_DIRECTORY'] = tempfile.mkdtemp(prefix='mareografie-benchmarks-')
+
+from ispra_rmn import csv_cache, http_pool, ispra_rmn_services, sparql_client
+from ispra_rmn.csv_reader import read_hydrometric_csv, read_latest_hydrometric_sample
+from ispra_rmn.ispra_rmn_services import get_discretized_hydrometric_level_nearby, get_hydrometric_level_distribution
+from ispra_rmn.ispra_rmn_stand_in import NEARBY, count_requests, serve_stand_in, stop_stand_in
+from ispra_rmn.quantile_window import create_quantile_window, discretize_levels, get_distribution_edges, get_latest_quantile_bin, update_quantile_window
+
+# ISPRA sampling period (in seconds).
+SAMPLING_PERIOD = 60*10
+
+# Gets the fixture hydrometric level series of a monthly period: a synthetic tide (lunar and solar semidiurnal
+# constituents, plus noise), sampled every 10 minutes, up to now for the current month.
+#
+# Args:
+# period: the monthly period, formatted as '%Y-%m'.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float64) columns, as NumPy arrays.
+def get_fixture_series(period):
+
+    start = datetime.strptime(period, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    start_time = int((start - datetime(1970, 1, 1)).total_seconds())
+    end_time = min(int((end - datetime(1970, 1, 1)).total_seconds()), int(time.time()))
+    utc = np.arange(start_time, end_time, SAMPLING_PERIOD, dtype=np.int64)
+
+    seed = int(hashlib.sha1(period.encode('utf-8')).hexdigest()[:8], 16)
+    noise = np.random.default_rng(seed).normal(0, 2, utc.size)
+    level = 25 + 20 * np.sin(2 * np.pi * utc / 44714) + 8 * np.sin(2 * np.pi * utc / 43200) + noise
+
+    return utc, np.round(level, 1)
+
+# Gets the fixture monthly distribution (CSV file) of a monthly period.
+#
+# Args:
+# period: the monthly period, formatted as '%Y-%m'.
+#
+# Returns: the monthly distribution, as bytes.
+def get_fixture_csv(period):
+
+    utc, level = get_fixture_series(period)
+    timestamps = utc.astype('datetime64[s]').astype(str)
+    rows = [timestamp.replace('T', ' ') + ';' + str(value) for timestamp, value in zip(timestamps, level)]
+
+    return ('utc;level\n' + '\n'.join(rows) + '\n').encode('utf-8')
+
+# Gets the fixture periods: the monthly periods of the last months, up to the current one.
+#
+# Args:
+# months: the number of months.
+#
+# Returns: the list of periods, formatted as '%Y-%m', in period order.
+def get_fixture_periods(months):
+
+    periods = []
+    when = datetime.now().replace(day=1)
+    for _ in range(months):
+        periods.insert(0, when.strftime('%Y-%m'))
+        when = (when - timedelta(days=1)).replace(day=1)
+
+    return periods
+
+# Serves the fixtures on a local ISPRA stand-in, in background, and points the ISPRA RMN services to it.
+#
+# Args:
+# months: the number of monthly distributions, up to the current month.
+# latency: the simulated latency (in seconds) of each request.
+#
+# Returns: the HTTP server.
+def serve_fixtures(months, latency):
+
+    server = serve_stand_in({period: get_fixture_csv(period) for period in get_fixture_periods(months)}, latency)
+    ispra_rmn_services.SPARQL_SERVICE = server.base_url + '/sparql'
+
+    return server
+
+# Resets the in-memory state of the ISPRA RMN services, keeping the local cache, like a restart.
+def reset_in_memory_state():
+
+    sparql_client.cached_responses.clear()
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+
+# Resets the local cache and the in-memory state of the ISPRA RMN services, for a cold start.
+def reset_caches():
+
+    shutil.rmtree(csv_cache.CACHE_DIRECTORY, ignore_errors=True)
+    reset_in_memory_state()
+
+# Times a function.
+#
+# Args:
+# function: the function.
+#
+# Returns: the elapsed time, in seconds.
+def time_function(function):
+
+    start = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start
+
+# Benchmarks the ingest of the hydrometric level distribution: cold (empty cache), and warm (cached).
+#
+# Args:
+# server: the ISPRA stand-in.
+# months: the number of monthly distributions.
+#
+# Returns: the benchmark results, as a list of dictionaries, like [{'benchmark': 'get_hydrometric_level_distribution', 'cache': 'cold', 'seconds': 1.02, 'requests': 14}, ...].
+def benchmark_ingest(server, months):
+
+    since = get_fixture_periods(months)[0]
+    results = []
+
+    reset_caches()
+    for cache in ('cold', 'warm'):
+        server.requests.clear()
+        seconds = time_function(lambda: get_hydrometric_level_distribution(NEARBY, since))
+        results.append({'benchmark': 'get_hydrometric_level_distribution', 'months': months, 'cache': cache, 'seconds': seconds, 'requests': count_requests(server)})
+
+    return results
+
+# Benchmarks get_discretized_hydrometric_level_nearby against the ISPRA stand-in (the last 365 days): cold (empty
+# cache), warm (cached), and — if incremental — on restart (cached, resuming from the warm-start snapshot).
+#
+# Args:
+# server: the ISPRA stand-in.
+# incremental: if true, ingests incrementally and updates a sliding quantile window.
+#
+# Returns: the benchmark results, as a list of dictionaries, like [{'benchmark': 'get_discretized_hydrometric_level_nearby', 'cache': 'cold', 'seconds': 1.4}, ...].
+def benchmark_discretized_level_nearby(server, incremental):
+
+    results = []
+
+    reset_caches()
+    for cache in ('cold', 'warm'):
+        server.requests.clear()
+        seconds = time_function(lambda: get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental))
+        results.append({'benchmark': 'get_discretized_hydrometric_level_nearby', 'incremental': incremental, 'cache': cache, 'seconds': seconds, 'requests': count_requests(server)})
+
+    if incremental:
+        reset_in_memory_state()
+        server.requests.clear()
+        seconds = time_function(lambda: get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental))
+        results.append({'benchmark': 'get_discretized_hydrometric_level_nearby', 'incremental': incremental, 'cache': 'restart', 'seconds': seconds, 'requests': count_requests(server)})
+
+    return results
+
+# Parses the utc and level columns of a hydrometric level distribution into typed columns, with pandas: the baseline
+# of the streaming reader (see csv_reader).
+# Rows with a malformed timestamp or level are skipped.
+#
+# Args:
+# utc: the utc column, like ['2019-05-01 00:00:00', '2019-05-01 00:10:00', ...].
+# level: the level column, like ['25.0', '22.4', ...].
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float64) columns, as NumPy arrays.
+def parse_columns(utc, level):
+
+    utc = pandas.to_datetime(pandas.Series(utc, dtype=str), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    level = pandas.to_numeric(pandas.Series(level), errors='coerce')
+    valid = utc.notna().values & level.notna().values
+
+    return utc.values[valid].astype('datetime64[s]').astype(np.int64), level.values[valid].astype(np.float64)
+
+# Benchmarks the parsing of a monthly distribution: as a whole, with the streaming reader and with pandas, and only
+# its latest sample, from its end.
+#
+# Args:
+# repeats: the number of repeats.
+#
+# Returns: the benchmark results, as a list of dictionaries, like [{'benchmark': 'read_hydrometric_csv', 'rows': 4464, 'seconds': 0.005}, ...].
+def benchmark_csv_parsing(repeats=5):
+
+    csv_path = os.path.join(csv_cache.CACHE_DIRECTORY, 'hydrometric.fixture.csv')
+    csv_cache.write_atomically(csv_path, get_fixture_csv('2020-05'))
+    rows, _ = get_fixture_series('2020-05')
+
+    def read_csv_with_pandas():
+        distribution = pandas.read_csv(csv_path, sep=';', header=0, names=['utc', 'level'], dtype=str)
+        parse_columns(distribution['utc'], distribution['level'])
+
+    return [
+        {'benchmark': 'read_hydrometric_csv', 'rows': rows.size, 'seconds': min(time_function(lambda: read_hydrometric_csv(csv_path)) for _ in range(repeats))},
+        {'benchmark': 'pandas.read_csv', 'rows': rows.size, 'seconds': min(time_function(read_csv_with_pandas) for _ in range(repeats))},
+        {'benchmark': 'read_latest_hydrometric_sample', 'rows': rows.size, 'seconds': min(time_function(lambda: read_latest_hydrometric_sample(csv_path)) for _ in range(repeats))}
+    ]
+
+# Benchmarks the discretization (quantile cuts) of a hydrometric level series of some years: cutting the whole
+# series (like get_discretized_hydrometric_level_nearby), and updating a sliding quantile window with a new sample.
+#
+# Args:
+# years: the number of years.
+# repeats: the number of repeats.
+#
+# Returns: the benchmark results, as a list of dictionaries, like [{'benchmark': 'discretize_levels', 'years': 10, 'samples': 525600, 'seconds': 0.21}, ...].
+def benchmark_discretization(years, repeats=5):
+
+    samples = years * 365 * 24 * 60*60 // SAMPLING_PERIOD
+    utc = np.arange(samples, dtype=np.int64) * SAMPLING_PERIOD
+    level = 25 + 20 * np.sin(2 * np.pi * utc / 44714) + np.random.default_rng(0).normal(0, 2, samples)
+
+    def cut_whole_series():
+        edges = get_distribution_edges(level, 8)
+        discretize_levels(level, edges)
+
+    window = create_quantile_window(span=years * 365 * 24 * 60*60)
+    update_quantile_window(window, utc, level)
+    next_samples = iter(range(samples, samples + repeats))
+
+    def update_window():
+        sample = next(next_samples)
+        update_quantile_window(window, [sample * SAMPLING_PERIOD], [25.0])
+        get_latest_quantile_bin(window, 8)
+
+    return [
+        {'benchmark': 'discretize_levels', 'years': years, 'samples': samples, 'seconds': min(time_function(cut_whole_series) for _ in range(repeats))},
+        {'benchmark': 'update_quantile_window', 'years': years, 'samples': samples, 'seconds': min(time_function(update_window) for _ in range(repeats))}
+    ]
+
+# Benchmarks the import time of modules, each in a fresh interpreter (cold start of the mareografie modules, with
+# warm OS caches): the fast startup path (the level state, the LED panel drawings) against the deferred heavy imports.
+#
+# Args:
+# modules: the module names.
+# repeats: the number of repeats.
+#
+# Returns: the benchmark results, as a list of dictionaries, like [{'benchmark': 'import', 'module': 'pandas', 'seconds': 0.48}, ...]
+# (seconds is None if the module cannot be imported).
+def benchmark_import_time(modules, repeats=3):
+
+    logger = logging.getLogger(__name__)
+
+    results = []
+    for module in modules:
+        script = 'import time; start = time.perf_counter(); import ' + module + '; print(time.perf_counter() - start)'
+        timings = []
+        for _ in range(repeats):
+            process = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True)
+            if process.returncode != 0:
+                logger.warning('Cannot import ' + module + ': ' + process.stderr.strip().splitlines()[-1])
+                break
+            timings.append(float(process.stdout))
+        results.append({'benchmark': 'import', 'module': module, 'seconds': min(timings) if len(timings) == repeats else None})
+
+    return results
+
+if __name__ == '__main__':
+
+    # Get command-line arguments.
+    parser = argparse.ArgumentParser(description='ISPRA RMN benchmarks', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--months', type=int, default=13, help='Number of monthly distributions served by the ISPRA stand-in')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated latency (in seconds) of each request')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+
+    server = serve_fixtures(args.months, args.latency)
+    results = []
+    try:
+        results.extend(benchmark_ingest(server, args.months))
+        for incremental in (False, True):
+            results.extend(benchmark_discretized_level_nearby(server, incremental))
+        results.extend(benchmark_csv_parsing())
+        for years in (1, 5, 10):
+            results.extend(benchmark_discretization(years))
+        results.extend(benchmark_import_time(['ispra_rmn.level_state', 'led_panel.led_panel_drawings', 'ispra_rmn.ispra_rmn_services', 'pandas', 'SPARQLWrapper']))
+    finally:
+        stop_stand_in(server)
+        http_pool.get_executor().shutdown()
+        shutil.rmtree(csv_cache.CACHE_DIRECTORY, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(result.pop('benchmark') + ' ' + ' '.join(key + '=' + (format(value, '.6g') if isinstance(value, float) else str(value)) for key, value in result.items()))
+
+# --------------------------------------------------
@@ -7,31 +7,54 @@
 
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas
 
+from ispra_rmn.csv_cache import get_cached_csv, get_entry_paths, read_metadata
+from ispra_rmn.csv_reader import read_hydrometric_csv, read_latest_hydrometric_sample
+from ispra_rmn.http_pool import map_concurrently
+from ispra_rmn.level_state import read_warm_start_state, write_warm_start_state
+from ispra_rmn.quantile_window import (create_quantile_window, discretize_levels, get_distribution_edges, get_latest_quantile_bin,
+                                       get_quantile_edges, update_quantile_window)
+from ispra_rmn.series_store import load_monthly_series
 from ispra_rmn.sparql_client import get_response
+from metrics import timed
 
-# Gets the "ISPRA Hydrometric Level" distribution: alta marea, bassa marea.
+# ISPRA SPARQL service.
+SPARQL_SERVICE = 'http://dati.isprambiente.it/sparql'
+
+# Quantile windows of the last 365 days, by tide gauge geographical reference:
+# {'Bari': <the quantile window (see quantile_window)>, ...}
+quantile_windows = {}
+
+# Warm-start snapshots resumed on restart (see level_state), until the quantile window is built again,
+# by tide gauge geographical reference.
+warm_start_states = {}
+
+# Time (in seconds) after which the quantile edges of a warm-start snapshot are got from the whole window again.
+WARM_START_EDGES_TTL = 60*60*24
+
+# Gets the catalogue of the monthly "ISPRA Hydrometric Level" distributions, in a single SPARQL request.
 #
 # Args:
-# nearby: the tide gauge geographical reference.
+# nearby: the tide gauge geographical reference, or a list of them.
 # since: the time-depth, formatted as '%Y-%m'.
 #
-# Returns: the hydrometric level distribution, as a pandas dataframe:
-#                        utc  level
-# 0      2019-05-01 00:00:00   25.0
-# 1      2019-05-01 00:10:00   22.4
-# 2      2019-05-01 00:20:00   26.3
-# 3      2019-05-01 00:30:00   24.3
-# 4      2019-05-01 00:40:00   25.0
+# Returns: the catalogue of monthly distributions, as a pandas dataframe:
+#   nearby.type nearby.value station.type               station.value period.type period.value csvUrl.type                                       csvUrl.value
+# 0     literal         Bari      literal  Bari tide gauge (RMN 2009)     literal      2019-05         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
+# 1     literal         Bari      literal  Bari tide gauge (RMN 2009)     literal      2019-06         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
 # ...
-def get_hydrometric_level_distribution(nearby, since):
+def get_monthly_distribution_catalogue(nearby, since):
 
     logger = logging.getLogger(__name__)
 
-    service = 'http://dati.isprambiente.it/sparql'
+    service = SPARQL_SERVICE
+
+    nearbies = [nearby] if isinstance(nearby, str) else list(nearby)
 
     request = ''
     request = request + 'PREFIX : <http://dati.isprambiente.it/ontology/core#>' + '\n'
@@ -39,9 +62,10 @@ def get_hydrometric_level_distribution(nearby, since):
     request = request + 'PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>' + '\n'
     request = request + 'PREFIX dcat: <http://www.w3.org/ns/dcat#>' + '\n'
     request = request + 'PREFIX purl: <http://purl.org/dc/terms/>' + '\n'
-    request = request + 'select distinct ?station ?period ?csvUrl where {' + '\n'
+    request = request + 'select distinct ?nearby ?station ?period ?csvUrl where {' + '\n'
+    request = request + 'VALUES ?nearby { ' + ' '.join('\"' + label + '\"' for label in nearbies) + ' }' + '\n'
     request = request + '?parameter a :HydrometricLevel.' + '\n'
-    request = request + '?place rdfs:label \"' + nearby + '\".' + '\n'
+    request = request + '?place rdfs:label ?nearby.' + '\n'
     request = request + '?dataset rdfs:label \"Dataset RMN\"@it.' + '\n'
     request = request + 'FILTER ( str(?period) >= \"' + since + '\").' + '\n'
     request = request + '?parameter gn:nearbyFeature ?place.' + '\n'
@@ -60,6 +84,7 @@ def get_hydrometric_level_distribution(nearby, since):
     #   "head": {
     #     "link": [],
     #     "vars": [
+    #       "nearby",
     #       "station",
     #       "period",
     #       "csvUrl"
@@ -70,6 +95,10 @@ def get_hydrometric_level_distribution(nearby, since):
     #     "ordered": true,
     #     "bindings": [
     #       {
+    #         "nearby": {
+    #           "type": "literal",
+    #           "value": "Bari"
+    #         },
     #         "station": {
     #           "type": "literal",
     #           "value": "Bari tide gauge (RMN 2009)"
@@ -85,6 +114,10 @@ def get_hydrometric_level_distribution(nearby, since):
     #       },
     #       ...
     #       {
+    #         "nearby": {
+    #           "type": "literal",
+    #           "value": "Bari"
+    #         },
     #         "station": {
     #           "type": "literal",
     #           "value": "Bari tide gauge (RMN 2009)"
@@ -107,17 +140,58 @@ def get_hydrometric_level_distribution(nearby, since):
         logger.debug(log)
 
     # Flatten the dictionary of monthly distributions:
-    #    station.type               station.value period.type period.value csvUrl.type                                       csvUrl.value
-    # 0       literal  Bari tide gauge (RMN 2009)     literal      2019-05         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
-    # 1       literal  Bari tide gauge (RMN 2009)     literal      2019-06         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
-    # 2       literal  Bari tide gauge (RMN 2009)     literal      2019-07         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
+    #   nearby.type nearby.value station.type               station.value period.type period.value csvUrl.type                                       csvUrl.value
+    # 0     literal         Bari      literal  Bari tide gauge (RMN 2009)     literal      2019-05         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
+    # 1     literal         Bari      literal  Bari tide gauge (RMN 2009)     literal      2019-06         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
+    # 2     literal         Bari      literal  Bari tide gauge (RMN 2009)     literal      2019-07         uri  http://dati.isprambiente.it/rmn/bari/hydrometr...
     # ...
     normalized_response = pandas.json_normalize(response['results']['bindings'])
+    if normalized_response.empty:
+        normalized_response = pandas.DataFrame(columns=['nearby.value', 'station.value', 'period.value', 'csvUrl.value'])
     logger.debug('Flattening the dictionary of monthly distributions...')
     for log in normalized_response.head(1).to_string().splitlines():
         logger.debug(log)
     logger.debug('...')
 
+    return normalized_response
+
+# Gets the "ISPRA Hydrometric Level" distribution: alta marea, bassa marea.
+#
+# Args:
+# nearby: the tide gauge geographical reference.
+# since: the time-depth, formatted as '%Y-%m'.
+#
+# Returns: the hydrometric level distribution, as a pandas dataframe:
+#                        utc  level
+# 0      2019-05-01 00:00:00   25.0
+# 1      2019-05-01 00:10:00   22.4
+# 2      2019-05-01 00:20:00   26.3
+# 3      2019-05-01 00:30:00   24.3
+# 4      2019-05-01 00:40:00   25.0
+# ...
+def get_hydrometric_level_distribution(nearby, since):
+
+    return get_hydrometric_level_distributions([nearby], since)[nearby]
+
+# Gets the "ISPRA Hydrometric Level" distributions of many tide gauges, resolving all their monthly distributions
+# in a single SPARQL request, and downloading them concurrently (once, even if shared by many tide gauges).
+#
+# Args:
+# nearbies: the list of tide gauge geographical references.
+# since: the time-depth, formatted as '%Y-%m'.
+#
+# Returns: the hydrometric level distributions, as a dictionary of pandas dataframes by tide gauge geographical reference:
+# {
+#   'Bari': <the hydrometric level distribution near Bari (see get_hydrometric_level_distribution)>,
+#   'Venezia': <the hydrometric level distribution near Venezia>,
+#   ...
+# }
+def get_hydrometric_level_distributions(nearbies, since):
+
+    logger = logging.getLogger(__name__)
+
+    normalized_response = get_monthly_distribution_catalogue(nearbies, since)
+
     # Get the URL of monthly distributions:
     # 0     http://dati.isprambiente.it/rmn/bari/hydrometr...
     # 1     http://dati.isprambiente.it/rmn/bari/hydrometr...
@@ -128,46 +202,230 @@ def get_hydrometric_level_distribution(nearby, since):
         logger.debug(log)
     logger.debug('...')
 
-    # Get and concatenate monthly distributions, iterating over their URLs.
-    logger.debug('Getting and concatenating monthly distributions, iterating over their URLs...')
-    monthly_distributions = [pandas.read_csv(url, sep=';', header=0, names=['utc', 'level']) for url in urls]
-    distribution = pandas.concat(monthly_distributions, ignore_index=True)
-    for log in distribution.head(1).to_string().splitlines():
-        logger.debug(log)
-    logger.debug('...')
+    # Get monthly distributions, downloading them concurrently through the local cache, once per URL.
+    logger.debug('Getting monthly distributions, iterating over their URLs...')
+    entries = normalized_response[['station.value', 'period.value', 'csvUrl.value']].drop_duplicates('csvUrl.value')
+    paths = map_concurrently(lambda entry: get_cached_csv(*entry), entries.itertuples(index=False, name=None))
+    monthly_distributions = {}
+    for url, path in zip(entries['csvUrl.value'], paths):
+        with timed('csv_parse_seconds'):
+            monthly_distributions[url] = pandas.read_csv(path, sep=';', header=0, names=['utc', 'level'])
 
-    return distribution
+    # Concatenate monthly distributions, by tide gauge geographical reference, in period order.
+    distributions = {}
+    for nearby in nearbies:
+        nearby_urls = normalized_response.loc[normalized_response['nearby.value'] == nearby, 'csvUrl.value']
+        if nearby_urls.empty:
+            logger.warning('No monthly distribution near ' + nearby + ' since ' + since + '.')
+            distributions[nearby] = pandas.DataFrame(columns=['utc', 'level'])
+            continue
+        distribution = pandas.concat([monthly_distributions[url] for url in nearby_urls], ignore_index=True)
+        logger.debug('Concatenating monthly distributions near ' + nearby + '...')
+        for log in distribution.head(1).to_string().splitlines():
+            logger.debug(log)
+        logger.debug('...')
+        distributions[nearby] = distribution
+
+    return distributions
+
+# Gets the "ISPRA Hydrometric Level" series, as typed columns, through the local columnar store: the memory-mapped
+# monthly columns are copied once, straight into the series, which a quantile window then takes as it is.
+#
+# Args:
+# nearby: the tide gauge geographical reference.
+# since: the time-depth, formatted as '%Y-%m'.
+# etags: if not None, a dictionary filled with the ETags of the cached monthly distributions, by URL (see
+# get_warm_start_level_nearby), defaulting to None.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float32) columns, as NumPy arrays.
+def get_hydrometric_level_series(nearby, since, etags=None):
+
+    logger = logging.getLogger(__name__)
+
+    normalized_response = get_monthly_distribution_catalogue(nearby, since)
+
+    # Get monthly series, downloading their distributions concurrently through the local cache.
+    logger.debug('Getting monthly series near ' + nearby + '...')
+    entries = list(zip(normalized_response['station.value'], normalized_response['period.value'], normalized_response['csvUrl.value']))
+    paths = map_concurrently(lambda entry: get_cached_csv(*entry), entries)
+    monthly_series = [load_monthly_series(station, period, path) for (station, period, _), path in zip(entries, paths)]
+    if etags is not None:
+        for station, period, url in entries:
+            etags[url] = (read_metadata(get_entry_paths(station, period)[1]) or {}).get('etag')
+    if not monthly_series:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # Concatenate monthly series, in period order.
+    utc = np.concatenate([monthly_utc for monthly_utc, _ in monthly_series])
+    level = np.concatenate([monthly_level for _, monthly_level in monthly_series])
+    logger.debug(str(len(level)) + ' samples near ' + nearby + ' since ' + since + '.')
+
+    return utc, level
+
+# Gets the samples of the "ISPRA Hydrometric Level" distribution newer than a given time: only the monthly distributions
+# since then are revalidated, and only their newer rows are parsed — backwards from their end, stopping at the given
+# time (see csv_reader) — whoever has downloaded them into the local cache.
+#
+# Args:
+# nearby: the tide gauge geographical reference.
+# latest_time: the time of the latest known sample, in seconds since the epoch.
+# etags: the expected ETags of the cached monthly distributions, by URL (see get_warm_start_level_nearby), defaulting to None.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float32, like the columnar store, so that a level on a
+# quantile edge got from the columnar store stays on it) columns of the newer samples, as NumPy arrays,
+# and the ETags of the monthly distributions since then, by URL; or None, None, and the ETags, if a cached monthly
+# distribution is not the expected one.
+def get_hydrometric_level_tail(nearby, latest_time, etags=None):
+
+    normalized_response = get_monthly_distribution_catalogue(nearby, time.strftime('%Y-%m', time.gmtime(latest_time)))
+    stations = normalized_response['station.value']
+    periods = normalized_response['period.value']
+    urls = normalized_response['csvUrl.value']
+
+    tails = []
+    tail_etags = {}
+    for station, period, url in zip(stations, periods, urls):
+        # A cached copy other than the expected one (e.g. evicted and downloaded again) may miss samples before the latest one.
+        _, metadata_path = get_entry_paths(station, period)
+        metadata = read_metadata(metadata_path) or {}
+        if etags is not None and url in etags and metadata.get('etag') != etags[url]:
+            return None, None, tail_etags
+
+        path = get_cached_csv(station, period, url)
+        tail_etags[url] = (read_metadata(metadata_path) or {}).get('etag')
+        tails.append(read_hydrometric_csv(path, newer_than=latest_time))
+    if not tails:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), tail_etags
+
+    return np.concatenate([utc for utc, _ in tails]), np.concatenate([level for _, level in tails]).astype(np.float32), tail_etags
+
+# Gets the quantile cuts (bin edges) of the "ISPRA Hydrometric Level" distribution of the last 365 days,
+# to discretize many levels at once (see quantile_window.discretize_levels), like:
+# edges = get_hydrometric_level_cuts_nearby('Bari', 8)
+# bins = discretize_levels([25.0, 22.4, 26.3], edges)
+#
+# Args:
+# here: the tide gauge geographical reference.
+# cuts: the quantile cuts, defaulting to 10 (deciles).
+#
+# Returns: the cuts + 1 quantile edges, as a NumPy array.
+def get_hydrometric_level_cuts_nearby(here, cuts=10):
+
+    when = datetime.now() - timedelta(days = 365)
+    since = when.strftime('%Y-%m')
+    _, level = get_hydrometric_level_series(here, since)
+
+    return get_distribution_edges(level, cuts)
+
+# Gets the current "ISPRA Hydrometric Level", as a segmented (cutted) value over quantiles, resuming from the
+# warm-start snapshot of a previous run: only the rows newer than its latest sample are got, and discretized over its
+# quantile edges, until they are older than WARM_START_EDGES_TTL.
+#
+# Args:
+# here: the tide gauge geographical reference.
+# cuts: the quantile cuts.
+#
+# Returns: the current hydrometric level, as a segmented (cutted) value over quantiles, or None if there is no usable
+# warm-start snapshot (missing, with other cuts, too old, or got from other cached monthly distributions).
+def get_warm_start_level_nearby(here, cuts):
+
+    logger = logging.getLogger(__name__)
+
+    state = warm_start_states.get(here) or read_warm_start_state(here)
+    if state is None or state['cuts'] != cuts or time.time() - state['edges_time'] > WARM_START_EDGES_TTL:
+        warm_start_states.pop(here, None)
+        return None
+
+    utc, levels, etags = get_hydrometric_level_tail(here, state['latest_sample_time'], state['etags'])
+    if utc is None:
+        logger.debug('The cached monthly distributions near ' + here + ' have changed since the warm-start snapshot.')
+        warm_start_states.pop(here, None)
+        return None
+
+    level = state['level']
+    latest_sample_time = state['latest_sample_time']
+    if levels.size > 0:
+        level = int(discretize_levels(levels[-1:], state['edges'])[0])
+        latest_sample_time = int(utc[-1])
+    warm_start_states[here] = write_warm_start_state(here, level, cuts, state['edges'], state['edges_time'], latest_sample_time, etags)
+    logger.info('Latest discretized (cutted) level value near ' + here + ' (warm start): ' + str(level))
+
+    return level
 
 # Gets the current "ISPRA Hydrometric Level", as a segmented (cutted) value over quantiles.
 #
 # Args:
 # here: the tide gauge geographical reference.
 # cuts: the quantile cuts, defaulting to 10 (deciles).
+# incremental: if true, ingests only the rows added since the latest request, and updates a sliding quantile window
+# of the last 365 days instead of cutting the whole distribution again, defaulting to false.
+# exact: if true, validates the sliding quantile window against pandas.qcut — never resuming from a warm-start snapshot
+# (see get_warm_start_level_nearby) — defaulting to false.
 #
 # Returns: the current hydrometric level, as a segmented (cutted) value over quantiles.
-def get_discretized_hydrometric_level_nearby(here, cuts=10):
+def get_discretized_hydrometric_level_nearby(here, cuts=10, incremental=False, exact=False):
 
     logger = logging.getLogger(__name__)
 
     # Get the hydrometric level distribution of the last 365 days.
     when = datetime.now() - timedelta(days = 365)
     since = when.strftime('%Y-%m')
-    distribution = get_hydrometric_level_distribution(here, since)
-    logger.debug(distribution)
+    if incremental:
+        # Resume from the warm-start snapshot of a previous run, if any, instead of ingesting the whole distribution
+        # (but not when validating against pandas.qcut: the snapshot has no window to validate).
+        if here not in quantile_windows and not exact:
+            level = get_warm_start_level_nearby(here, cuts)
+            if level is not None:
+                return level
 
-    # Discretize (cut) the the hydrometric level value over quantiles.
-    distribution['quantilized_bin'] = pandas.qcut(distribution['level'], q=cuts)
-    distribution['quantilized_bin_label'] = pandas.qcut(distribution['level'], q=cuts, labels=[str(i) for i in range(1, cuts+1)])
-    distribution['quantilized_bin_label'] = pandas.to_numeric(distribution['quantilized_bin_label'])
-    logger.debug(distribution)
+        # Build the quantile window the first time, from the typed columns of the local columnar store; then update it
+        # with the samples newer than its latest one only.
+        window = quantile_windows.get(here)
+        if window is None or window['utc'].size == 0:
+            logger.debug('Building the quantile window near ' + here + ' since ' + since + '...')
+            window = create_quantile_window()
+            etags = {}
+            update_quantile_window(window, *get_hydrometric_level_series(here, since, etags))
+        else:
+            utc, levels, etags = get_hydrometric_level_tail(here, int(window['utc'][-1]))
+            update_quantile_window(window, utc, levels)
+        quantile_windows[here] = window
+        level = get_latest_quantile_bin(window, cuts, exact)
+        logger.info('Latest discretized (cutted) level value near ' + here + ': ' + str(level))
 
-    # Get the latest distretized (cutted) hydrometric level value
-    level = distribution.quantilized_bin_label.iat[-1]
+        # Snapshot the latest level and quantile edges, for a warm start.
+        write_warm_start_state(here, level, cuts, get_quantile_edges(window, cuts), time.time(), window['utc'][-1], etags)
+
+        return level
+
+    _, levels = get_hydrometric_level_series(here, since)
+    logger.debug(str(levels.size) + ' levels near ' + here + ' since ' + since + '.')
+
+    # Discretize (cut) the latest hydrometric level value over the quantiles of the distribution.
+    edges = get_distribution_edges(levels, cuts)
+    level = int(discretize_levels(levels[-1:], edges)[0])
     logger.info('Latest discretized (cutted) level value near ' + here + ': ' + str(level))
     
     return level
 
-# Gets the current "ISPRA Hydrometric Level" value.
+# Gets the time of the latest "ISPRA Hydrometric Level" sample, as ingested incrementally, or resumed from a warm-start
+# snapshot (see get_discretized_hydrometric_level_nearby).
+#
+# Args:
+# here: the tide gauge geographical reference.
+#
+# Returns: the time of the latest sample, in seconds since the epoch, or None if nothing has been ingested yet.
+def get_latest_sample_time_nearby(here):
+
+    window = quantile_windows.get(here)
+    if window is None or window['utc'].size == 0:
+        state = warm_start_states.get(here)
+        return state['latest_sample_time'] if state is not None else None
+
+    return int(window['utc'][-1])
+
+# Gets the current "ISPRA Hydrometric Level" value, reading only the latest sample, from the end of the latest
+# (cached) monthly distribution.
 #
 # Args:
 # here: the tide gauge geographical reference.
@@ -182,13 +440,18 @@ def get_hydrometric_level_nearby(here):
     if when.day == 1:
         when = when - timedelta(days=1)
     now = when.strftime('%Y-%m')
-    latest_monthly_distribution = get_hydrometric_level_distribution(here, now)
+    normalized_response = get_monthly_distribution_catalogue(here, now)
+    entries = list(zip(normalized_response['station.value'], normalized_response['period.value'], normalized_response['csvUrl.value']))
 
-    # Get the latest level value
-    level = latest_monthly_distribution.level.iat[-1]
-    logger.info('Latest level value near ' + here + ': ' + str(level))
-    
-    return level
+    # Get the latest level value, from the latest monthly distribution with a valid sample
+    for station, period, url in reversed(entries):
+        sample = read_latest_hydrometric_sample(get_cached_csv(station, period, url))
+        if sample is not None:
+            _, level = sample
+            logger.info('Latest level value near ' + here + ': ' + str(level))
+            return level
+
+    raise ValueError('No hydrometric level sample near ' + here + ' since ' + now + '.')
 
 if __name__ == '__main__':
 
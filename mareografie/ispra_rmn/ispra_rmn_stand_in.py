@@ -0,0 +1,167 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Local HTTP stand-in of the ISPRA service, for the benchmarks and the tests: it serves the SPARQL catalogue, on
+# /sparql, and fixture monthly distributions (CSV files), on /rmn/bari/hydrometric.YYYYMM.csv, with ETag, Range and
+# If-Range support, after a simulated latency. It keeps track of the requests (and of the requests in flight), and
+# fails the requests of some paths on purpose:
+# {
+#   'fixtures': {'2019-05': <the monthly distribution, as bytes>, ...},
+#   'latency': 0.05,
+#   'latencies': {<a path>: <its latency, in seconds>, ...},
+#   'failures': {<a path>: <the number of requests to fail, with 503>, ...},
+#   'requests': {<a path>: <the number of requests>, ...},
+#   'in_flight': 0,
+#   'max_in_flight': 3
+# }
+# (as attributes of the HTTP server). Fixtures may be changed while serving, e.g. to append samples to a month.
+
+import hashlib
+import json
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fixture tide gauge.
+NEARBY = 'Bari'
+STATION = 'Bari tide gauge (RMN 2009)'
+
+# HTTP request handler of the ISPRA stand-in.
+class stand_in_request_handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        parts = urllib.parse.urlsplit(self.path)
+        with server.lock:
+            server.requests[parts.path] = server.requests.get(parts.path, 0) + 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            failure = server.failures.get(parts.path, 0) > 0
+            if failure:
+                server.failures[parts.path] -= 1
+        try:
+            server.stop.wait(server.latencies.get(parts.path, server.latency))
+            match = re.fullmatch(r'/rmn/bari/hydrometric\.(\d{4})(\d{2})\.csv', parts.path)
+            if failure:
+                self.send_content(503, b'', 'text/plain')
+            elif parts.path == '/sparql':
+                self.send_catalogue(urllib.parse.parse_qs(parts.query).get('query', [''])[0])
+            elif match and match.group(1) + '-' + match.group(2) in server.fixtures:
+                self.send_distribution(server.fixtures[match.group(1) + '-' + match.group(2)])
+            else:
+                self.send_content(404, b'', 'text/plain')
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def send_catalogue(self, request):
+        nearbies = re.findall(r'"([^"]*)"', re.search(r'VALUES \?nearby \{([^}]*)\}', request).group(1))
+        since = re.search(r'str\(\?period\) >= "([^"]*)"', request).group(1)
+        bindings = [{
+            'nearby': {'type': 'literal', 'value': NEARBY},
+            'station': {'type': 'literal', 'value': STATION},
+            'period': {'type': 'literal', 'value': period},
+            'csvUrl': {'type': 'uri', 'value': self.server.base_url + get_fixture_path(period)}
+        } for period in sorted(self.server.fixtures) if NEARBY in nearbies and period >= since]
+        response = {'head': {'link': [], 'vars': ['nearby', 'station', 'period', 'csvUrl']}, 'results': {'distinct': False, 'ordered': True, 'bindings': bindings}}
+        self.send_content(200, json.dumps(response).encode('utf-8'), 'application/sparql-results+json')
+
+    def send_distribution(self, content):
+        etag = get_fixture_etag(content)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_content(304, b'', 'text/csv', etag)
+            return
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range', etag) == etag:
+            start = int(match.group(1))
+            if start >= len(content):
+                self.send_content(416, b'', 'text/csv', etag)
+            else:
+                self.send_content(206, content[start:], 'text/csv', etag)
+            return
+        self.send_content(200, content, 'text/csv', etag)
+
+    def send_content(self, status, content, content_type, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+# Gets the path of the fixture monthly distribution of a monthly period.
+#
+# Args:
+# period: the monthly period, formatted as '%Y-%m'.
+#
+# Returns: the path, like '/rmn/bari/hydrometric.201905.csv'.
+def get_fixture_path(period):
+
+    return '/rmn/bari/hydrometric.' + period.replace('-', '') + '.csv'
+
+# Gets the ETag of a fixture monthly distribution.
+#
+# Args:
+# content: the monthly distribution, as bytes.
+#
+# Returns: the ETag, like '"3f786850e387550fdab836ed7e6dc881de23001b"'.
+def get_fixture_etag(content):
+
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
+# Serves fixture monthly distributions on a local ISPRA stand-in, in background.
+#
+# Args:
+# fixtures: the monthly distributions, as bytes, by monthly period.
+# latency: the simulated latency (in seconds) of each request, defaulting to 0.
+#
+# Returns: the HTTP server.
+def serve_stand_in(fixtures, latency=0):
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), stand_in_request_handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.stop = threading.Event()
+    server.fixtures = fixtures
+    server.latency = latency
+    server.latencies = {}
+    server.failures = {}
+    server.requests = {}
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.base_url = 'http://127.0.0.1:' + str(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+# Stops a local ISPRA stand-in, releasing the stalled requests.
+#
+# Args:
+# server: the HTTP server.
+def stop_stand_in(server):
+
+    server.stop.set()
+    server.shutdown()
+    server.server_close()
+
+# Counts the requests served by a local ISPRA stand-in.
+#
+# Args:
+# server: the HTTP server.
+#
+# Returns: the number of requests.
+def count_requests(server):
+
+    with server.lock:
+        return sum(server.requests.values())
+
+# --------------------------------------------------
@@ -0,0 +1,130 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Warm-start snapshot of the ISPRA hydrometric ingest, by tide gauge, in a tiny on-disk state file: written atomically
+# after each refresh, so that on restart the LED panel can show the last known levels at once — before the (slow)
+# imports, downloads and parsing of the first refresh — and the refresh can resume from the latest sample instead of
+# ingesting the last 365 days again:
+# ~/.mareografie/cache/state.json
+# {
+#   'Bari': {
+#     'level': 5,
+#     'cuts': 8,
+#     'time': <when the level was got, in seconds since the epoch>,
+#     'edges': [<the quantile edges of the last 365 days>, ...],
+#     'edges_time': <when the quantile edges were got from the whole window, in seconds since the epoch>,
+#     'latest_sample_time': 1590969000,
+#     'etags': {<the URL of a cached monthly distribution>: <its ETag>, ...}
+#   },
+#   ...
+# }
+#
+# This module is imported on the fast startup path: it must not import pandas, NumPy or SPARQLWrapper.
+
+import json
+import logging
+import os
+import time
+
+from ispra_rmn.csv_cache import CACHE_DIRECTORY, write_atomically
+
+# State path, in the cache directory (never evicted: eviction only considers the CSV entries).
+STATE_PATH = os.path.join(CACHE_DIRECTORY, 'state.json')
+
+# Reads the state file.
+#
+# Args:
+# path: the state path.
+#
+# Returns: the state, as a dictionary by tide gauge geographical reference (empty if missing or unreadable).
+def read_state(path=STATE_PATH):
+
+    logger = logging.getLogger(__name__)
+
+    try:
+        with open(path, 'r') as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        logger.warning('Cannot read the level state: ' + str(error))
+        return {}
+
+    return state if isinstance(state, dict) else {}
+
+# Reads the latest discretized hydrometric levels. Levels discretized over other quantile cuts (e.g. before a
+# configuration change) are ignored: they may not even fit the LED panel anymore.
+#
+# Args:
+# stations: the tide gauge geographical references.
+# cuts: the quantile cuts.
+# path: the state path, defaulting to STATE_PATH.
+#
+# Returns: the latest levels, by tide gauge geographical reference (only those known), like {'Bari': 5}.
+def read_level_state(stations, cuts, path=STATE_PATH):
+
+    logger = logging.getLogger(__name__)
+
+    state = read_state(path)
+    levels = {}
+    for here in stations:
+        entry = state.get(here)
+        if isinstance(entry, dict) and isinstance(entry.get('level'), int) and entry.get('cuts') == cuts:
+            levels[here] = entry['level']
+            logger.debug('Last known level near ' + here + ': ' + str(entry['level']) + ' (' + str(int(time.time() - entry.get('time', 0))) + ' s old).')
+
+    return levels
+
+# Reads the warm-start snapshot of a tide gauge.
+#
+# Args:
+# here: the tide gauge geographical reference.
+# path: the state path, defaulting to STATE_PATH.
+#
+# Returns: the warm-start snapshot, as a dictionary, or None if missing or incomplete.
+def read_warm_start_state(here, path=STATE_PATH):
+
+    entry = read_state(path).get(here)
+    if not isinstance(entry, dict) or not all(key in entry for key in ('level', 'cuts', 'edges', 'edges_time', 'latest_sample_time', 'etags')):
+        return None
+
+    return entry
+
+# Writes the warm-start snapshot of a tide gauge, atomically, keeping the other ones.
+#
+# Args:
+# here: the tide gauge geographical reference.
+# level: the latest discretized level.
+# cuts: the quantile cuts of the level.
+# edges: the quantile edges.
+# edges_time: when the quantile edges were got from the whole window, in seconds since the epoch.
+# latest_sample_time: the time of the latest sample, in seconds since the epoch.
+# etags: the ETags of the cached monthly distributions, by URL.
+# path: the state path, defaulting to STATE_PATH.
+#
+# Returns: the warm-start snapshot, as a dictionary.
+def write_warm_start_state(here, level, cuts, edges, edges_time, latest_sample_time, etags, path=STATE_PATH):
+
+    logger = logging.getLogger(__name__)
+
+    entry = {
+        'level': int(level),
+        'cuts': int(cuts),
+        'time': time.time(),
+        'edges': [float(edge) for edge in edges],
+        'edges_time': edges_time,
+        'latest_sample_time': int(latest_sample_time),
+        'etags': dict(etags)
+    }
+    state = read_state(path)
+    state[here] = entry
+    try:
+        write_atomically(path, json.dumps(state, sort_keys=True).encode('utf-8'))
+    except OSError as error:
+        logger.warning('Cannot write the level state: ' + str(error))
+
+    return entry
+
+# --------------------------------------------------
@@ -0,0 +1,176 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Exact sliding-window quantiles of the hydrometric level.
+#
+# A quantile window keeps the samples of the latest span (e.g. 365 days) twice: in time order, to expire them,
+# and in level order, to get quantiles. New samples are inserted, and expired samples removed, by binary search,
+# so that the quantile cuts of the latest level are got without sorting the whole window again:
+# {
+#   'span': 31536000,
+#   'utc': <the utc column, in seconds since the epoch, in time order>,
+#   'level': <the level column, in time order>,
+#   'sorted_level': <the level column, in level order>
+# }
+# Levels are kept as float32, like in the columnar store (see series_store), whatever the dtype of the new samples:
+# the same level, got from the columnar store or parsed from a CSV file, is the same value, on the same side of
+# the quantile edges.
+
+import logging
+
+import numpy as np
+import pandas
+
+from metrics import timed
+
+# Creates an empty quantile window.
+#
+# Args:
+# span: the span (in seconds) of the window, defaulting to 365 days.
+#
+# Returns: the quantile window, as a dictionary.
+def create_quantile_window(span=60*60*24*365):
+
+    return {
+        'span': span,
+        'utc': np.empty(0, dtype=np.int64),
+        'level': np.empty(0, dtype=np.float32),
+        'sorted_level': np.empty(0, dtype=np.float32)
+    }
+
+# Updates a quantile window with new samples, and expires the samples older than its span.
+# Samples not newer than the latest one in the window are ignored. An empty window takes the new columns as they are
+# (if int64 and float32, like a series got from the columnar store), without copying them: they must not be changed.
+#
+# Args:
+# window: the quantile window.
+# utc: the utc column of new samples (in seconds since the epoch, in time order).
+# level: the level column of new samples.
+def update_quantile_window(window, utc, level):
+
+    logger = logging.getLogger(__name__)
+
+    utc = np.asarray(utc, dtype=np.int64)
+    level = np.asarray(level, dtype=np.float32)
+    if window['utc'].size > 0:
+        newer = utc > window['utc'][-1]
+        utc, level = utc[newer], level[newer]
+
+    # Insert new samples: sort them as a whole if they outnumber the window, otherwise by binary search.
+    if level.size > 0:
+        if window['utc'].size == 0:
+            window['utc'], window['level'] = utc, level
+        else:
+            window['utc'] = np.concatenate((window['utc'], utc))
+            window['level'] = np.concatenate((window['level'], level))
+        if level.size >= window['sorted_level'].size:
+            window['sorted_level'] = np.sort(window['level'])
+        else:
+            sorted_level = np.sort(level)
+            window['sorted_level'] = np.insert(window['sorted_level'], np.searchsorted(window['sorted_level'], sorted_level), sorted_level)
+
+    # Expire the samples older than the span.
+    if window['utc'].size > 0:
+        expired = np.searchsorted(window['utc'], window['utc'][-1] - window['span'], side='left')
+        if expired > 0:
+            logger.debug('Expiring ' + str(expired) + ' samples from the quantile window...')
+            expired_level = np.sort(window['level'][:expired])
+            window['utc'] = window['utc'][expired:]
+            window['level'] = window['level'][expired:]
+            # Equal levels are removed at consecutive positions: the first one, plus its rank among the equal ones.
+            positions = np.searchsorted(window['sorted_level'], expired_level, side='left')
+            positions = positions + np.arange(expired_level.size) - np.searchsorted(expired_level, expired_level, side='left')
+            window['sorted_level'] = np.delete(window['sorted_level'], positions)
+
+# Gets the quantile cuts (bin edges) of sorted levels, by linear interpolation between the neighbouring levels of each
+# quantile position, like numpy.quantile (and pandas.qcut), in float64. Edges must be unique, like in pandas.qcut.
+#
+# Args:
+# sorted_level: the levels, in level order, as a NumPy array.
+# cuts: the quantile cuts.
+#
+# Returns: the cuts + 1 quantile edges, as a NumPy array.
+def get_sorted_level_edges(sorted_level, cuts):
+
+    if sorted_level.size == 0:
+        raise ValueError('No levels to cut.')
+
+    positions = np.linspace(0, 1, cuts + 1) * (sorted_level.size - 1)
+    previous = np.floor(positions).astype(np.intp)
+    following = np.minimum(previous + 1, sorted_level.size - 1)
+    weight = positions - previous
+    lower = sorted_level[previous].astype(np.float64)
+    upper = sorted_level[following].astype(np.float64)
+    difference = upper - lower
+    edges = np.where(weight >= 0.5, upper - difference * (1 - weight), lower + difference * weight)
+    if np.any(np.diff(edges) == 0):
+        raise ValueError('Bin edges must be unique: ' + str(edges))
+
+    return edges
+
+# Gets the quantile cuts (bin edges) of a window, without sorting it again.
+#
+# Args:
+# window: the quantile window.
+# cuts: the quantile cuts, defaulting to 10 (deciles).
+#
+# Returns: the cuts + 1 quantile edges, as a NumPy array.
+def get_quantile_edges(window, cuts=10):
+
+    return get_sorted_level_edges(window['sorted_level'], cuts)
+
+# Gets the quantile cuts (bin edges) of a distribution of levels, like pandas.qcut.
+#
+# Args:
+# levels: the levels, as an array.
+# cuts: the quantile cuts, defaulting to 10 (deciles).
+#
+# Returns: the cuts + 1 quantile edges, as a NumPy array.
+def get_distribution_edges(levels, cuts=10):
+
+    with timed('quantile_cut_seconds'):
+        edges = get_sorted_level_edges(np.sort(np.asarray(levels)), cuts)
+
+    return edges
+
+# Discretizes (cuts) levels over quantile edges, by binary search: bins are right-closed, and the first one
+# includes the lowest edge, like pandas.qcut. Levels out of the edges fall in the first or last bin.
+#
+# Args:
+# levels: the levels, as an array.
+# edges: the quantile edges (see get_quantile_edges and get_distribution_edges).
+#
+# Returns: the quantile bins (from 1 to the number of cuts) of the levels, as a NumPy array of integers.
+def discretize_levels(levels, edges):
+
+    bins = np.searchsorted(edges, np.asarray(levels), side='left')
+
+    return np.clip(bins, 1, len(edges) - 1)
+
+# Gets the quantile bin (from 1 to cuts) of the latest level in a window.
+#
+# Args:
+# window: the quantile window.
+# cuts: the quantile cuts, defaulting to 10 (deciles).
+# exact: if true, validates the result against pandas.qcut over the whole window (slow), defaulting to false.
+#
+# Returns: the quantile bin of the latest level.
+def get_latest_quantile_bin(window, cuts=10, exact=False):
+
+    logger = logging.getLogger(__name__)
+
+    with timed('quantile_cut_seconds'):
+        edges = get_quantile_edges(window, cuts)
+    level = int(discretize_levels(window['level'][-1:], edges)[0])
+
+    if exact:
+        expected_level = int(pandas.qcut(window['level'].astype(np.float64), q=cuts, labels=False)[-1]) + 1
+        if expected_level != level:
+            logger.warning('Quantile window mismatch: ' + str(level) + ' instead of ' + str(expected_level) + ' (pandas.qcut).')
+            level = expected_level
+
+    return level
+
+# --------------------------------------------------
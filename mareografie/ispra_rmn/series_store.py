@@ -0,0 +1,87 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Local columnar store of the monthly hydrometric series.
+#
+# Each monthly distribution (CSV file) is parsed once, and stored — next to it, in the local cache — as typed columns:
+# ~/.mareografie/cache/bari_tide_gauge_rmn_2009/hydrometric.2019-05.utc.npy    (int64, seconds since the epoch)
+# ~/.mareografie/cache/bari_tide_gauge_rmn_2009/hydrometric.2019-05.level.npy  (float32)
+# Columns are loaded as memory-mapped NumPy arrays — read once, straight into the concatenated series (see
+# ispra_rmn_services.get_hydrometric_level_series) — and stored again only when their CSV file changes.
+
+import logging
+import os
+
+import numpy as np
+
+from ispra_rmn.csv_cache import CACHE_DIRECTORY, get_entry_paths
+from ispra_rmn.csv_reader import read_hydrometric_csv
+
+# Gets the paths of the columns of a monthly series.
+#
+# Args:
+# station: the station, like 'Bari tide gauge (RMN 2009)'.
+# period: the monthly period, formatted as '%Y-%m'.
+# cache_directory: the cache directory.
+#
+# Returns: the paths of the utc and level columns.
+def get_column_paths(station, period, cache_directory=CACHE_DIRECTORY):
+
+    csv_path, _ = get_entry_paths(station, period, cache_directory)
+    prefix = csv_path[:-len('.csv')]
+
+    return prefix + '.utc.npy', prefix + '.level.npy'
+
+# Parses a monthly distribution (CSV file) into typed columns, straight from its rows (see csv_reader).
+# Rows with a malformed timestamp or level are skipped.
+#
+# Args:
+# csv_path: the path of the monthly distribution.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float32) columns, as NumPy arrays.
+def parse_monthly_series(csv_path):
+
+    utc, level = read_hydrometric_csv(csv_path)
+
+    return utc, level.astype(np.float32)
+
+# Stores the typed columns of a monthly series, atomically.
+#
+# Args:
+# utc_path: the path of the utc column.
+# level_path: the path of the level column.
+# utc: the utc column.
+# level: the level column.
+def store_columns(utc_path, level_path, utc, level):
+
+    for path, column in ((utc_path, utc), (level_path, level)):
+        temporary_path = path + '.tmp.npy'
+        np.save(temporary_path, column)
+        os.replace(temporary_path, path)
+
+# Loads a monthly series from the columnar store, (re)storing it from its CSV file if missing or outdated.
+#
+# Args:
+# station: the station, like 'Bari tide gauge (RMN 2009)'.
+# period: the monthly period, formatted as '%Y-%m'.
+# csv_path: the path of the (cached) monthly distribution.
+# cache_directory: the cache directory.
+#
+# Returns: the utc (int64, seconds since the epoch) and level (float32) columns, as memory-mapped NumPy arrays.
+def load_monthly_series(station, period, csv_path, cache_directory=CACHE_DIRECTORY):
+
+    logger = logging.getLogger(__name__)
+
+    utc_path, level_path = get_column_paths(station, period, cache_directory)
+
+    csv_time = os.path.getmtime(csv_path)
+    if not all(os.path.exists(path) and os.path.getmtime(path) >= csv_time for path in (utc_path, level_path)):
+        logger.debug('Storing the monthly series ' + utc_path + '...')
+        utc, level = parse_monthly_series(csv_path)
+        store_columns(utc_path, level_path, utc, level)
+
+    return np.load(utc_path, mmap_mode='r'), np.load(level_path, mmap_mode='r')
+
+# --------------------------------------------------
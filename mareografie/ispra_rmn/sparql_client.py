@@ -4,26 +4,165 @@
 # --------------------------------------------------
 
 # Simple SPARQL client.
+#
+# Responses are cached — in memory, and on disk across restarts — by service and normalized request:
+# a fresh response (younger than the TTL) is returned as is; a stale response is returned as well,
+# while it is revalidated in background (stale-while-revalidate), so that a slow or unavailable
+# SPARQL service does not stall the caller.
 
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
 
 from SPARQLWrapper import JSON, SPARQLWrapper
 
+from ispra_rmn import csv_cache
+from ispra_rmn.csv_cache import write_atomically
+from metrics import timed
+
+# Cache directory.
+CACHE_DIRECTORY = os.path.join(csv_cache.CACHE_DIRECTORY, 'sparql')
+
+# Time-to-live (in seconds) of cached responses.
+TTL = 60*60
+
+# Cached responses, by cache key: {'time': <the time of the response, in seconds since the epoch>, 'response': <the response>}.
+cached_responses = {}
+
+# Cache keys being revalidated in background.
+revalidating = set()
+
+# Cache statistics.
+statistics = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'errors': 0}
+
+cache_lock = threading.Lock()
+
 # Posts the request to a SPARQL service, and returns the response.
 #
 # Args:
 # service: the SPARQL service.
 # request: the SPARQL request.
+# ttl: the time-to-live (in seconds) of cached responses, defaulting to TTL (None to bypass the cache).
 #
 # Returns: the SPARQL response, as json data.
-def get_response(service, request):
+def get_response(service, request, ttl=TTL):
+
+    logger = logging.getLogger(__name__)
+
+    if ttl is None:
+        return query(service, request)
+
+    key = get_key(service, request)
+    with cache_lock:
+        entry = cached_responses.get(key) or read_entry(key)
+        if entry is not None:
+            cached_responses[key] = entry
+
+        # A fresh response is returned as is.
+        if entry is not None and time.time() - entry['time'] <= ttl:
+            statistics['hits'] += 1
+            return entry['response']
+
+        # A stale response is returned as well, while it is revalidated in background.
+        if entry is not None:
+            statistics['stale_hits'] += 1
+            if key not in revalidating:
+                revalidating.add(key)
+                logger.debug('Revalidating the cached SPARQL response ' + key + ' in background...')
+                threading.Thread(target=revalidate, args=(key, service, request), daemon=True).start()
+            return entry['response']
 
-    # logger = logging.getLogger(__name__)
+        statistics['misses'] += 1
+
+    response = query(service, request)
+    store(key, response)
+
+    return response
+
+# Gets the cache statistics.
+#
+# Returns: the cache statistics, as a dictionary, like {'hits': 142, 'stale_hits': 3, 'misses': 2, 'errors': 1}.
+def get_cache_statistics():
+
+    with cache_lock:
+        return dict(statistics)
+
+# Posts the request to a SPARQL service, bypassing the cache.
+#
+# Args:
+# service: the SPARQL service.
+# request: the SPARQL request.
+#
+# Returns: the SPARQL response, as json data.
+def query(service, request):
 
     sparql = SPARQLWrapper(service)
     sparql.setQuery(request)
     sparql.setReturnFormat(JSON)
 
-    return sparql.query().convert()
+    with timed('sparql_request_seconds'):
+        return sparql.query().convert()
 
-# --------------------------------------------------
\ No newline at end of file
+# Revalidates a cached response, keeping the stale one if the SPARQL service fails.
+#
+# Args:
+# key: the cache key.
+# service: the SPARQL service.
+# request: the SPARQL request.
+def revalidate(key, service, request):
+
+    logger = logging.getLogger(__name__)
+
+    try:
+        store(key, query(service, request))
+    except Exception as error:
+        logger.warning('Cannot revalidate the cached SPARQL response (' + str(error) + '), keeping the stale one.')
+        with cache_lock:
+            statistics['errors'] += 1
+    finally:
+        with cache_lock:
+            revalidating.discard(key)
+
+# Gets the cache key of a request: the digest of the service and of the normalized (whitespace-collapsed) request.
+#
+# Args:
+# service: the SPARQL service.
+# request: the SPARQL request.
+#
+# Returns: the cache key.
+def get_key(service, request):
+
+    normalized_request = ' '.join(request.split())
+
+    return hashlib.sha1((service + '\n' + normalized_request).encode('utf-8')).hexdigest()
+
+# Reads a cached response from disk.
+#
+# Args:
+# key: the cache key.
+#
+# Returns: the cache entry, or None if missing or unreadable.
+def read_entry(key):
+
+    try:
+        with open(os.path.join(CACHE_DIRECTORY, key + '.json'), 'r') as entry_file:
+            return json.load(entry_file)
+    except (OSError, ValueError):
+        return None
+
+# Stores a response in the cache, in memory and on disk.
+#
+# Args:
+# key: the cache key.
+# response: the SPARQL response, as json data.
+def store(key, response):
+
+    entry = {'time': time.time(), 'response': response}
+    with cache_lock:
+        cached_responses[key] = entry
+    write_atomically(os.path.join(CACHE_DIRECTORY, key + '.json'), json.dumps(entry).encode('utf-8'))
+
+# --------------------------------------------------
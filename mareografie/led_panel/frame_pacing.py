@@ -0,0 +1,92 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Deadline-based frame pacing for the LED panel device.
+#
+# A frame pacer schedules frames at a target rate on the monotonic clock: each deadline is the previous one plus
+# the frame period — not the end of the previous frame plus the period — so that the time spent drawing (e.g. in
+# SPI writes) does not make the frame rate drift. If drawing falls behind by more than a frame, the late frames are
+# skipped and the deadlines are realigned:
+# {
+#   'period': <the frame period, in seconds>,
+#   'deadline': <the next deadline, on the monotonic clock>,
+#   'previous_frame': <the time of the previous frame, on the monotonic clock>,
+#   'intervals': <the latest frame intervals, in seconds>,
+#   'late_frames': <the number of skipped frames>
+# }
+
+import logging
+import statistics
+import time
+from collections import deque
+
+# Creates a frame pacer.
+#
+# Args:
+# fps: the target frame rate (in frames per second), defaulting to 2.
+# window: the number of latest frame intervals kept for the jitter statistics, defaulting to 256.
+#
+# Returns: the frame pacer, as a dictionary.
+def create_frame_pacer(fps=2, window=256):
+
+    return {
+        'period': 1 / fps,
+        'deadline': None,
+        'previous_frame': None,
+        'intervals': deque(maxlen=window),
+        'late_frames': 0
+    }
+
+# Waits until the next frame deadline, and schedules the following one.
+#
+# Args:
+# pacer: the frame pacer.
+# wait: the function waiting for a time (in seconds), defaulting to time.sleep (e.g. an Event.wait, to be interruptible).
+def wait_for_next_frame(pacer, wait=time.sleep):
+
+    logger = logging.getLogger(__name__)
+
+    now = time.monotonic()
+    if pacer['deadline'] is None:
+        pacer['deadline'] = now
+
+    # Behind by more than a frame: skip the late frames, and realign the deadlines.
+    if now - pacer['deadline'] > pacer['period']:
+        late_frames = int((now - pacer['deadline']) // pacer['period'])
+        pacer['late_frames'] += late_frames
+        pacer['deadline'] += late_frames * pacer['period']
+        logger.debug('Skipping ' + str(late_frames) + ' late frames...')
+
+    if pacer['deadline'] > now:
+        wait(pacer['deadline'] - now)
+
+    frame = time.monotonic()
+    if pacer['previous_frame'] is not None:
+        pacer['intervals'].append(frame - pacer['previous_frame'])
+    pacer['previous_frame'] = frame
+    pacer['deadline'] += pacer['period']
+
+# Gets the frame-time jitter statistics of a frame pacer, over its latest frame intervals.
+#
+# Args:
+# pacer: the frame pacer.
+#
+# Returns: the jitter statistics (in seconds), as a dictionary, like
+# {'frames': 256, 'mean_interval': 0.5001, 'jitter': 0.0004, 'max_deviation': 0.0021, 'late_frames': 0}.
+def get_frame_jitter(pacer):
+
+    intervals = pacer['intervals']
+    if not intervals:
+        return {'frames': 0, 'mean_interval': None, 'jitter': None, 'max_deviation': None, 'late_frames': pacer['late_frames']}
+
+    return {
+        'frames': len(intervals),
+        'mean_interval': statistics.fmean(intervals),
+        'jitter': statistics.pstdev(intervals),
+        'max_deviation': max(abs(interval - pacer['period']) for interval in intervals),
+        'late_frames': pacer['late_frames']
+    }
+
+# --------------------------------------------------
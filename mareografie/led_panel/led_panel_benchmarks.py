@@ -0,0 +1,362 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Benchmarks for the LED panel device, without hardware: frames are sent to a counting serial (or DMA) interface.
+# Results are printed as text, or as JSON — a list of dictionaries, one per benchmark — to track regressions.
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+from PIL import Image
+from luma.led_matrix.device import apa102, max7219, neosegment, unicornhathd, ws2812
+
+from frame_pacing import create_frame_pacer, get_frame_jitter, wait_for_next_frame
+from led_panel_drawings import (compose_level_matrix, create_frame_bank, create_panel_engine, draw_boolean_matrix, draw_level, render_panel_engine,
+                                 set_panel_level)
+
+# Serial interface that only counts transactions and bytes, in place of the SPI one.
+class counting_serial(object):
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def command(self, *cmd):
+        self.transactions += 1
+        self.bytes += len(cmd)
+
+    def data(self, data):
+        self.transactions += 1
+        self.bytes += len(data)
+
+    def cleanup(self):
+        pass
+
+# DMA interface that only counts LED updates and renders, in place of the rpi_ws281x one.
+class counting_dma(object):
+
+    WS2811_STRIP_GRB = 0x00081000
+
+    def __init__(self):
+        self.led_updates = 0
+        self.renders = 0
+
+    def new_ws2811_t(self):
+        return object()
+
+    def ws2811_channel_get(self, leds, channum):
+        return channum
+
+    def ws2811_init(self, leds):
+        return 0
+
+    def ws2811_led_set(self, channel, led, color):
+        self.led_updates += 1
+
+    def ws2811_render(self, leds):
+        self.renders += 1
+        return 0
+
+    # Any other function (setters, fini, delete) does nothing.
+    def __getattr__(self, name):
+        return lambda *args: None
+
+# Gets random 1-bit frames.
+#
+# Args:
+# size: the frame size, as (width, height).
+# frames: the number of frames.
+# seed: the random seed.
+#
+# Returns: the list of frames, as PIL images.
+def get_random_frames(size, frames, seed=0):
+
+    generator = np.random.default_rng(seed)
+
+    return [Image.fromarray(generator.random((size[1], size[0])) < 0.5).convert('1') for _ in range(frames)]
+
+# Gets random colour frames.
+#
+# Args:
+# size: the frame size, as (width, height).
+# frames: the number of frames.
+# mode: the image mode, like 'RGB' or 'RGBA'.
+# seed: the random seed.
+#
+# Returns: the list of frames, as PIL images.
+def get_random_colour_frames(size, frames, mode, seed=0):
+
+    generator = np.random.default_rng(seed)
+
+    return [Image.fromarray(generator.integers(0, 256, (size[1], size[0], len(mode)), dtype=np.uint8), mode) for _ in range(frames)]
+
+# Benchmarks max7219.display.
+#
+# Args:
+# cascaded: the number of cascaded MAX7219 LED matrices.
+# frames: the number of frames.
+# changing: if true, every frame differs from the previous one; otherwise the same frame is displayed again.
+# block_orientation: corrects block orientation when wired vertically, defaulting to 0 (choices are [0, 90, -90, 180]).
+# inreverse: has to be true if blocks are in reverse order, defaulting to false.
+#
+# Returns: the benchmark result, as a dictionary, like {'cascaded': 4, 'changing': True, 'fps': 5120.3, 'spi_transactions_per_frame': 8.0}.
+def benchmark_max7219_display(cascaded, frames=1000, changing=True, block_orientation=0, inreverse=False):
+
+    serial = counting_serial()
+    device = max7219(serial, cascaded=cascaded, block_orientation=block_orientation, blocks_arranged_in_reverse_order=inreverse)
+    images = get_random_frames(device.size, frames if changing else 1)
+    serial.transactions = serial.bytes = 0
+
+    start = time.perf_counter()
+    for i in range(frames):
+        device.display(images[i % len(images)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'max7219.display',
+        'cascaded': cascaded,
+        'changing': changing,
+        'fps': frames / elapsed,
+        'spi_transactions_per_frame': serial.transactions / frames,
+        'spi_bytes_per_frame': serial.bytes / frames
+    }
+
+# Benchmarks the frame pacing of max7219.display: the jitter of the frame intervals around the frame period.
+#
+# Args:
+# cascaded: the number of cascaded MAX7219 LED matrices.
+# fps: the target frame rate (in frames per second).
+# frames: the number of frames.
+#
+# Returns: the benchmark result, as a dictionary, like {'cascaded': 4, 'fps': 50, 'mean_interval': 0.02, 'jitter': 0.0001, ...}.
+def benchmark_max7219_frame_pacing(cascaded, fps=50, frames=100):
+
+    device = max7219(counting_serial(), cascaded=cascaded)
+    images = get_random_frames(device.size, frames)
+    pacer = create_frame_pacer(fps)
+
+    for image in images:
+        device.display(image)
+        wait_for_next_frame(pacer)
+
+    return dict(benchmark='max7219 frame pacing', cascaded=cascaded, fps=fps, **get_frame_jitter(pacer))
+
+# Benchmarks ws2812.display.
+#
+# Args:
+# leds: the number of LEDs.
+# frames: the number of frames.
+# changing: if true, every frame differs from the previous one; otherwise the same frame is displayed again.
+#
+# Returns: the benchmark result, as a dictionary, like {'leds': 64, 'changing': True, 'fps': 812.5, 'led_updates_per_frame': 64.0, ...}.
+def benchmark_ws2812_display(leds, frames=1000, changing=True):
+
+    dma = counting_dma()
+    device = ws2812(dma, width=leds, height=1)
+    images = get_random_colour_frames(device.size, frames if changing else 1, device.mode)
+    dma.led_updates = dma.renders = 0
+
+    start = time.perf_counter()
+    for i in range(frames):
+        device.display(images[i % len(images)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'ws2812.display',
+        'leds': leds,
+        'changing': changing,
+        'fps': frames / elapsed,
+        'led_updates_per_frame': dma.led_updates / frames,
+        'renders_per_frame': dma.renders / frames
+    }
+
+# Benchmarks apa102.display.
+#
+# Args:
+# leds: the number of LEDs.
+# frames: the number of frames.
+#
+# Returns: the benchmark result, as a dictionary, like {'leds': 64, 'fps': 1520.3, 'spi_bytes_per_frame': 768.0, ...}.
+def benchmark_apa102_display(leds, frames=1000):
+
+    serial = counting_serial()
+    device = apa102(serial, width=leds, height=1)
+    images = get_random_colour_frames(device.size, frames, device.mode)
+    serial.transactions = serial.bytes = 0
+
+    start = time.perf_counter()
+    for image in images:
+        device.display(image)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'apa102.display',
+        'leds': leds,
+        'fps': frames / elapsed,
+        'spi_transactions_per_frame': serial.transactions / frames,
+        'spi_bytes_per_frame': serial.bytes / frames
+    }
+
+# Benchmarks unicornhathd.display (16x16 LEDs).
+#
+# Args:
+# frames: the number of frames.
+#
+# Returns: the benchmark result, as a dictionary, like {'fps': 2410.9, 'spi_bytes_per_frame': 769.0, ...}.
+def benchmark_unicornhathd_display(frames=1000):
+
+    serial = counting_serial()
+    device = unicornhathd(serial)
+    images = get_random_colour_frames(device.size, frames, device.mode)
+    serial.transactions = serial.bytes = 0
+
+    start = time.perf_counter()
+    for image in images:
+        device.display(image)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'unicornhathd.display',
+        'fps': frames / elapsed,
+        'spi_transactions_per_frame': serial.transactions / frames,
+        'spi_bytes_per_frame': serial.bytes / frames
+    }
+
+# Benchmarks the text rendering of neosegment, on a ws2812 device, with live numeric tide levels like '+23.4'.
+#
+# Args:
+# frames: the number of texts.
+#
+# Returns: the benchmark result, as a dictionary, like {'fps': 3050.2, 'renders_per_frame': 1.0}.
+def benchmark_neosegment_text(frames=1000):
+
+    dma = counting_dma()
+    device = neosegment(width=6, device=ws2812(dma, width=6, height=7))
+    texts = ['{:+.1f}'.format(level) for level in np.round(np.random.default_rng(0).normal(0, 20, 100), 1)]
+    dma.led_updates = dma.renders = 0
+
+    start = time.perf_counter()
+    for i in range(frames):
+        device.text = texts[i % len(texts)]
+    elapsed = time.perf_counter() - start
+
+    return {'benchmark': 'neosegment.text', 'fps': frames / elapsed, 'renders_per_frame': dma.renders / frames}
+
+# Benchmarks compose_level_matrix.
+#
+# Args:
+# frames: the number of level matrices.
+#
+# Returns: the benchmark result, as a dictionary, like {'fps': 21000.4}.
+def benchmark_compose_level_matrix(frames=1000):
+
+    start = time.perf_counter()
+    for i in range(frames):
+        compose_level_matrix(i % 8 + 1)
+    elapsed = time.perf_counter() - start
+
+    return {'benchmark': 'compose_level_matrix', 'fps': frames / elapsed}
+
+# Benchmarks the drawing of level matrices on a MAX7219 LED panel: composed on the fly and drawn with
+# draw_boolean_matrix, or drawn from a frame bank with draw_level.
+#
+# Args:
+# frames: the number of frames.
+# frame_bank: if true, draws from a frame bank; otherwise composes level matrices on the fly.
+#
+# Returns: the benchmark result, as a dictionary, like {'frame_bank': True, 'fps': 9120.7, 'spi_transactions_per_frame': 3.1}.
+def benchmark_draw_level(frames=1000, frame_bank=False):
+
+    serial = counting_serial()
+    device = max7219(serial, cascaded=1)
+    bank = create_frame_bank(seed=0) if frame_bank else None
+    serial.transactions = serial.bytes = 0
+
+    start = time.perf_counter()
+    for i in range(frames):
+        if frame_bank:
+            draw_level(device, i % 8 + 1, bank, milliseconds=0)
+        else:
+            draw_boolean_matrix(device, compose_level_matrix(i % 8 + 1), 0)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'draw_level' if frame_bank else 'draw_boolean_matrix',
+        'frame_bank': frame_bank,
+        'fps': frames / elapsed,
+        'spi_transactions_per_frame': serial.transactions / frames
+    }
+
+# Benchmarks the multi-panel render engine, on a cascaded MAX7219 LED panel, one 8X8 block per station.
+#
+# Args:
+# stations: the number of stations.
+# animated: the number of stations with a level (animated on each render); the others are blank.
+# frames: the number of frames.
+#
+# Returns: the benchmark result, as a dictionary, like {'stations': 16, 'animated': 16, 'fps': 8120.5, 'spi_transactions_per_frame': 8.0}.
+def benchmark_panel_engine(stations, animated, frames=1000):
+
+    serial = counting_serial()
+    device = max7219(serial, cascaded=stations)
+    engine = create_panel_engine(device, [str(station) for station in range(stations)], create_frame_bank(seed=0))
+    for station in range(animated):
+        set_panel_level(engine, str(station), station % 8 + 1)
+    serial.transactions = serial.bytes = 0
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        render_panel_engine(engine)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'benchmark': 'render_panel_engine',
+        'stations': stations,
+        'animated': animated,
+        'fps': frames / elapsed,
+        'spi_transactions_per_frame': serial.transactions / frames,
+        'spi_bytes_per_frame': serial.bytes / frames
+    }
+
+if __name__ == '__main__':
+
+    # Get command-line arguments.
+    parser = argparse.ArgumentParser(description='LED panel benchmarks', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--frames', type=int, default=1000, help='Number of frames per benchmark')
+    parser.add_argument('--block-orientation', type=int, default=0, choices=[0, 90, -90, 180], help='Corrects block orientation when wired vertically')
+    parser.add_argument('--reverse-order', action='store_true', help='Blocks are in reverse order')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+
+    results = []
+    for cascaded in (1, 4, 16):
+        for changing in (True, False):
+            results.append(benchmark_max7219_display(cascaded, args.frames, changing, args.block_orientation, args.reverse_order))
+    for cascaded in (1, 16):
+        results.append(benchmark_max7219_frame_pacing(cascaded))
+    for leds in (64, 256):
+        for changing in (True, False):
+            results.append(benchmark_ws2812_display(leds, args.frames, changing))
+        results.append(benchmark_apa102_display(leds, args.frames))
+    results.append(benchmark_unicornhathd_display(args.frames))
+    results.append(benchmark_neosegment_text(args.frames))
+    results.append(benchmark_compose_level_matrix(args.frames))
+    for frame_bank in (False, True):
+        results.append(benchmark_draw_level(args.frames, frame_bank))
+    for stations, animated in ((1, 1), (16, 1), (16, 16)):
+        results.append(benchmark_panel_engine(stations, animated, args.frames))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(result.pop('benchmark') + ' ' + ' '.join(key + '=' + (format(value, '.6g') if isinstance(value, float) else str(value)) for key, value in result.items()))
+
+# --------------------------------------------------
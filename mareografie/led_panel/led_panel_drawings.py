@@ -11,21 +11,26 @@ import time
 
 import numpy as np
 from luma.core.interface.serial import noop, spi
-from luma.core.legacy import show_message, text
-from luma.core.legacy.font import (CP437_FONT, LCD_FONT, SINCLAIR_FONT, TINY_FONT, proportional)
 from luma.core.render import canvas
 from luma.led_matrix.device import max7219
+from PIL import Image
 
 # Gets the LED panel device, in its default configuration.
 #
+# Args:
+# serial_wrapper: a function wrapping the SPI serial interface (e.g. to time its transactions), defaulting to None.
+# cascaded: the number of cascaded panels, defaulting to 1.
+#
 # Returns: the device - a MAX7219 LED panel - in its default configuration.
-def get_device_in_default_configuration():
+def get_device_in_default_configuration(serial_wrapper=None, cascaded=1):
 
     logger = logging.getLogger(__name__)
 
     logger.debug('Getting LED panel device, in its default configuration...')
     serial = spi(port=0, device=0, gpio=noop())
-    device = max7219(serial, cascaded = 1, block_orientation = 0, rotate = 0, blocks_arranged_in_reverse_order = False)
+    if serial_wrapper is not None:
+        serial = serial_wrapper(serial)
+    device = max7219(serial, cascaded = cascaded, block_orientation = 0, rotate = 0, blocks_arranged_in_reverse_order = False)
  
     return device
 
@@ -57,6 +62,10 @@ def write(device, text_message):
 
     logger = logging.getLogger(__name__)
 
+    # Deferred import: the fonts are only loaded when a text message is written.
+    from luma.core.legacy import show_message
+    from luma.core.legacy.font import CP437_FONT, proportional
+
     logger.debug('Writing \"' + text_message + '\"...')
     show_message(device, text_message, fill='white', font=proportional(CP437_FONT))
 
@@ -70,7 +79,8 @@ def draw_point(device, point, milliseconds):
 
     with canvas(device) as draw:
         draw.point(point, fill='white')
-    time.sleep(milliseconds/1000)
+    if milliseconds > 0:
+        time.sleep(milliseconds/1000)
 
 # Turn on an array of LED elements.
 #
@@ -81,7 +91,8 @@ def draw_point(device, point, milliseconds):
 def draw_points(device, points, milliseconds):
     with canvas(device) as draw:
         draw.point(points, fill='white')
-    time.sleep(milliseconds/1000)
+    if milliseconds > 0:
+        time.sleep(milliseconds/1000)
 
 # Draws a boolean matrix, like this:
 # [[0, 1, 1, 0, 0, 1, 0, 0],
@@ -102,7 +113,12 @@ def draw_boolean_matrix(device, boolean_matrix, milliseconds):
 
     logger = logging.getLogger(__name__)
 
-    # Get the xy_coordinates of the LED elements with value 1
+    # Draw the boolean matrix directly, if the device supports it.
+    if hasattr(device, 'display_pixels'):
+        draw_bitmap(device, np.asarray(boolean_matrix) == 1, milliseconds)
+        return
+
+    # Otherwise, get the xy_coordinates of the LED elements with value 1
     index_of_elements_with_value_1 = np.where(boolean_matrix == 1)
     xy_coordinates_of_elements_with_value_1 = list(zip(index_of_elements_with_value_1[1], index_of_elements_with_value_1[0]))
 
@@ -111,7 +127,8 @@ def draw_boolean_matrix(device, boolean_matrix, milliseconds):
     logger.debug(xy_coordinates_of_elements_with_value_1)
     with canvas(device) as draw:
         draw.point(xy_coordinates_of_elements_with_value_1, fill='white')
-    time.sleep(milliseconds/1000)
+    if milliseconds > 0:
+        time.sleep(milliseconds/1000)
 
 # Composes a boolean matrix representing dinamically a fluid level.
 #
@@ -124,7 +141,7 @@ def compose_level_matrix(level):
     matrix_dimension = 8
 
     # Populate the submatrix above the level with 0 values.
-    above_the_level = np.random.choice((0, 1), (matrix_dimension - level, matrix_dimension), p = [1, 0])
+    above_the_level = np.zeros((matrix_dimension - level, matrix_dimension), dtype=int)
     logger.debug('Above the level:')
     logger.debug(above_the_level)
 
@@ -145,14 +162,188 @@ def compose_level_matrix(level):
 
     return level_matrix
 
+# Creates a frame bank: a ring of random level matrices per level (from 1 to matrix_dimension), composed like
+# compose_level_matrix, in a single batched random draw, and stored as packed columns (one bit per LED element, the
+# top row being the least significant bit, as in the MAX7219 digit registers, so frames need no encoding when drawn):
+# {
+#   'frames': <the packed level matrices, as a NumPy array of bytes, by level - 1, frame, 8-row band, and column>,
+#   'cursors': <the next frame, by level - 1>
+# }
+# The bank takes matrix_dimension * frames_per_level * matrix_dimension * ceil(matrix_dimension / 8) bytes.
+#
+# Args:
+# frames_per_level: the number of frames per level, defaulting to 64.
+# seed: the random seed, defaulting to None (unpredictable).
+# matrix_dimension: the matrix dimension, defaulting to 8.
+#
+# Returns: the frame bank, as a dictionary.
+def create_frame_bank(frames_per_level=64, seed=None, matrix_dimension=8):
+
+    logger = logging.getLogger(__name__)
+
+    # Probability of value 1, by level - 1 and row: 0 above the level, 50% at the level, 99% below the level.
+    levels = np.arange(1, matrix_dimension + 1)[:, np.newaxis]
+    rows = np.arange(matrix_dimension)[np.newaxis, :]
+    probabilities = np.select([rows < matrix_dimension - levels, rows == matrix_dimension - levels], [0, .50], .99)
+
+    generator = np.random.default_rng(seed)
+    draws = generator.random((matrix_dimension, frames_per_level, matrix_dimension, matrix_dimension))
+    frames = np.packbits(draws < probabilities[:, np.newaxis, :, np.newaxis], axis=-2, bitorder='little')
+    logger.debug('Frame bank: ' + str(frames.nbytes) + ' bytes.')
+
+    return {'frames': frames, 'cursors': np.zeros(matrix_dimension, dtype=int)}
+
+# Gets the next frame of a level from a frame bank, cycling over its ring.
+#
+# Args:
+# frame_bank: the frame bank.
+# level: the level value.
+#
+# Returns: the frame, as packed columns (a NumPy array of bytes, by 8-row band and column).
+def get_next_frame(frame_bank, level):
+
+    ring = frame_bank['frames'][level - 1]
+    cursor = frame_bank['cursors'][level - 1]
+    frame_bank['cursors'][level - 1] = (cursor + 1) % len(ring)
+
+    return ring[cursor]
+
+# Draws a bitmap - a boolean matrix, as a NumPy array - passing it straight to the device, without drawing on a canvas.
+# A bitmap smaller than the device is drawn on its top-left corner.
+#
+# Args:
+# device: the device.
+# bitmap: the bitmap.
+# milliseconds: the time (in milliseconds) during wich LEDs are turned on.
+def draw_bitmap(device, bitmap, milliseconds):
+
+    bitmap = fit_bitmap(device, np.asarray(bitmap, dtype=bool))
+    if hasattr(device, 'display_pixels'):
+        device.display_pixels(bitmap)
+    else:
+        device.display(Image.fromarray(bitmap).convert('1'))
+    if milliseconds > 0:
+        time.sleep(milliseconds/1000)
+
+# Draws a frame of packed columns (one bit per LED element, the top row of each 8-row band being the least
+# significant bit), without drawing on a canvas: MAX7219 devices take the bytes as digit registers, other devices
+# (or other sizes) take the unpacked bitmap.
+#
+# Args:
+# device: the device.
+# packed_columns: the packed columns.
+# milliseconds: the time (in milliseconds) during wich LEDs are turned on.
+def draw_packed_columns(device, packed_columns, milliseconds):
+
+    if hasattr(device, 'display_packed_columns') and packed_columns.shape == (device.height // 8, device.width):
+        device.display_packed_columns(packed_columns)
+        if milliseconds > 0:
+            time.sleep(milliseconds/1000)
+    else:
+        draw_bitmap(device, np.unpackbits(packed_columns, axis=0, bitorder='little'), milliseconds)
+
+# Fits a bitmap to the device size, padding (or cropping) it on its bottom-right side.
+#
+# Args:
+# device: the device.
+# bitmap: the bitmap.
+#
+# Returns: the bitmap, with the device size.
+def fit_bitmap(device, bitmap):
+
+    if bitmap.shape == (device.height, device.width):
+        return bitmap
+
+    fitted_bitmap = np.zeros((device.height, device.width), dtype=bool)
+    height = min(device.height, bitmap.shape[0])
+    width = min(device.width, bitmap.shape[1])
+    fitted_bitmap[:height, :width] = bitmap[:height, :width]
+
+    return fitted_bitmap
+
 # Draws a level matrix.
 #
 # Args:
 # device: the device.
 # level: the level value.
-def draw_level(device, level):
+# frame_bank: the frame bank to draw the level matrix from, defaulting to None (compose it on the fly).
+# milliseconds: the time (in milliseconds) during wich LEDs are turned on, defaulting to 500 (0 to return at once, when frames are paced by a frame pacer).
+def draw_level(device, level, frame_bank=None, milliseconds=500):
+
+    if frame_bank is not None:
+        draw_packed_columns(device, get_next_frame(frame_bank, level), milliseconds)
+    else:
+        draw_boolean_matrix(device, compose_level_matrix(level), milliseconds)
+
+# Creates a multi-panel render engine, drawing the level of many stations on a cascaded LED panel, one 8X8 block
+# (panel) per station, from left to right:
+# {
+#   'device': <the device>,
+#   'stations': ['Bari', 'Venezia', ...],
+#   'levels': <the level value by station, 0 if unknown yet>,
+#   'changed': <whether the level of each station has changed since the latest render>,
+#   'frame': <the whole frame, as packed columns: eight bytes (columns) per block>,
+#   'frame_bank': <the frame bank (see create_frame_bank)>
+# }
+# Each render composes only the blocks to be redrawn — the animated ones (with a level) and the changed ones —
+# into the whole frame, and draws it on the device at once.
+#
+# Args:
+# device: the device, with 8 rows and 8 columns per station.
+# stations: the list of stations (tide gauge geographical references).
+# frame_bank: the frame bank of 8X8 level matrices, defaulting to None (create one).
+#
+# Returns: the render engine, as a dictionary.
+def create_panel_engine(device, stations, frame_bank=None):
+
+    if device.width != 8 * len(stations) or device.height != 8:
+        raise ValueError('The device (' + str(device.width) + 'x' + str(device.height) + ') does not fit ' + str(len(stations)) + ' 8X8 blocks.')
+
+    return {
+        'device': device,
+        'stations': list(stations),
+        'levels': np.zeros(len(stations), dtype=int),
+        'changed': np.ones(len(stations), dtype=bool),
+        'frame': np.zeros((1, 8 * len(stations)), dtype=np.uint8),
+        'frame_bank': frame_bank if frame_bank is not None else create_frame_bank()
+    }
+
+# Sets the level of a station, to be drawn on the next render.
+#
+# Args:
+# engine: the render engine.
+# station: the station (tide gauge geographical reference).
+# level: the level value.
+def set_panel_level(engine, station, level):
+
+    block = engine['stations'].index(station)
+    if engine['levels'][block] != level:
+        engine['levels'][block] = level
+        engine['changed'][block] = True
+
+# Renders the levels of all stations, drawing the whole frame on the device with a single display call
+# (nothing is drawn if no block needs to be redrawn).
+#
+# Args:
+# engine: the render engine.
+#
+# Returns: the number of redrawn blocks.
+def render_panel_engine(engine):
+
+    levels = engine['levels']
+    blocks = np.flatnonzero((levels > 0) | engine['changed'])
+    if blocks.size == 0:
+        return 0
+
+    frame = engine['frame']
+    for block in blocks.tolist():
+        level = int(levels[block])
+        frame[0, 8 * block:8 * block + 8] = get_next_frame(engine['frame_bank'], level)[0] if level > 0 else 0
+    engine['changed'][:] = False
+
+    draw_packed_columns(engine['device'], frame, 0)
 
-    draw_boolean_matrix(device, compose_level_matrix(level), 500)
+    return blocks.size
 
 if __name__ == '__main__':
 
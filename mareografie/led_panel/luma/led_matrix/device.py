@@ -32,11 +32,13 @@ Collection of serial interfaces to LED matrix devices.
 # As before, as soon as the with block completes, the canvas buffer is flushed
 # to the device
 
+import numpy as np
+from PIL import Image, ImageColor
+
 import luma.core.error
 import luma.led_matrix.const
 from luma.core.interface.serial import noop
 from luma.core.device import device
-from luma.core.render import canvas
 from luma.core.util import observable
 from luma.core.virtual import sevensegment
 from luma.led_matrix.segment_mapper import dot_muncher, regular
@@ -76,10 +78,11 @@ class max7219(device):
         self._correction_angle = block_orientation
 
         self.cascaded = cascaded or (width * height) // 64
-        self._offsets = [(y * self._w) + x
-                         for y in range(self._h - 8, -8, -8)
-                         for x in range(self._w - 8, -8, -8)]
-        self._rows = list(range(8))
+        self._digits = np.zeros((8, self.cascaded), dtype=np.uint8)
+        self._last_digits = None
+        self._buffer = np.empty((8, self.cascaded, 2), dtype=np.uint8)
+        self._buffer[:, :, 0] = np.arange(8, dtype=np.uint8)[:, np.newaxis] + self._const.DIGIT_0
+        self._permutation = self._pixel_permutation()
 
         self.data([self._const.SCANLIMIT, 7] * self.cascaded)
         self.data([self._const.DECODEMODE, 0] * self.cascaded)
@@ -89,29 +92,48 @@ class max7219(device):
         self.clear()
         self.show()
 
-    def preprocess(self, image):
+    def _pixel_permutation(self):
         """
-        Performs the inherited behviour (if any), and if the LED matrix
-        orientation is declared to need correction, each 8x8 block of pixels
-        is rotated 90° clockwise or counter-clockwise.
+        Precomputes, as a flat index into the pixels of an incoming image,
+        where each pixel of the preprocessed frame comes from: the display
+        rotation, then each 8x8 block rotated by the orientation correction,
+        then the blocks of the first row in reverse order, if so arranged.
+        Returns ``None`` for the identity permutation.
         """
-        image = super(max7219, self).preprocess(image)
+        index = np.arange(self.width * self.height).reshape(self.height, self.width)
+        index = np.rot90(index, k=-self.rotate)
 
         if self._correction_angle != 0:
-            image = image.copy()
-            for y in range(0, self._h, 8):
-                for x in range(0, self._w, 8):
-                    box = (x, y, x + 8, y + 8)
-                    rotated_block = image.crop(box).rotate(self._correction_angle)
-                    image.paste(rotated_block, box)
+            blocks = index.reshape(self._h // 8, 8, self._w // 8, 8).transpose(0, 2, 1, 3)
+            blocks = np.rot90(blocks, k=self._correction_angle // 90, axes=(2, 3))
+            index = blocks.transpose(0, 2, 1, 3).reshape(self._h, self._w)
         if self.blocks_arranged_in_reverse_order:
-            old_image = image.copy()
-            for y in range(8):
-                for x in range(8):
-                    for i in range(self.cascaded):
-                        image.putpixel((8 * (self.cascaded - 1) - i * 8 + x, y), old_image.getpixel((i * 8 + x, y)))
+            index = index.copy()
+            index[:8] = index[:8].reshape(8, self._w // 8, 8)[:, ::-1, :].reshape(8, self._w)
+
+        index = np.ascontiguousarray(index).ravel()
+        if np.array_equal(index, np.arange(index.size)):
+            return None
+
+        return index
+
+    def preprocess(self, image):
+        """
+        Performs the display rotation and, if the LED matrix orientation is
+        declared to need correction, rotates each 8x8 block of pixels 90°
+        clockwise or counter-clockwise, through the precomputed pixel
+        permutation.
+        """
+        return Image.fromarray(self._preprocess_pixels(np.asarray(image, dtype=bool)))
 
-        return image
+    def _preprocess_pixels(self, pixels):
+        """
+        Applies the precomputed pixel permutation to a boolean pixel array in
+        one gather (none if the permutation is the identity).
+        """
+        if self._permutation is None:
+            return pixels
+        return pixels.ravel()[self._permutation].reshape(self._h, self._w)
 
     def display(self, image):
         """
@@ -121,33 +143,73 @@ class max7219(device):
         assert(image.mode == self.mode)
         assert(image.size == self.size)
 
-        image = self.preprocess(image)
+        pixels = self._preprocess_pixels(np.asarray(image, dtype=bool))
+        self._display_digits(self._encode(pixels))
 
-        i = 0
-        d0 = self._const.DIGIT_0
-        step = 2 * self.cascaded
-        offsets = self._offsets
-        rows = self._rows
+    def display_pixels(self, pixels):
+        """
+        Takes a boolean (or 0/1 integer) NumPy array, shaped as the display
+        ``(height, width)``, and dumps it to the LED matrix display via the
+        MAX7219 serializers, without any :py:mod:`PIL.Image` round trip.
+        """
+        pixels = np.asarray(pixels, dtype=bool)
+        assert(pixels.shape == (self.height, self.width))
 
-        buf = bytearray(8 * step)
-        pix = list(image.getdata())
+        self._display_digits(self._encode(self._preprocess_pixels(pixels)))
 
-        for digit in range(8):
-            for daisychained_device in offsets:
-                byte = 0
-                idx = daisychained_device + digit
-                for y in rows:
-                    if pix[idx] > 0:
-                        byte |= 1 << y
-                    idx += self._w
+    def display_packed_columns(self, packed_columns):
+        """
+        Takes packed columns - a NumPy array of bytes shaped
+        ``(height // 8, width)``, bit ``y`` of each byte being the pixel row
+        ``y`` of its 8-row band, as in the MAX7219 digit registers - and dumps
+        them to the LED matrix display. If the pixel permutation is the
+        identity, the bytes are copied as they are into the digit registers,
+        with no unpacking, gathering or repacking; otherwise they take the
+        :py:meth:`display_pixels` path.
+        """
+        packed_columns = np.asarray(packed_columns, dtype=np.uint8)
+        assert(packed_columns.shape == (self.height // 8, self.width))
+
+        if self._permutation is not None:
+            self.display_pixels(np.unpackbits(packed_columns, axis=0, bitorder='little'))
+            return
 
-                buf[i] = digit + d0
-                buf[i + 1] = byte
-                i += 2
+        # Same block order as _encode: the farthest device (the last block) first.
+        blocks = packed_columns.reshape(self._h // 8, self._w // 8, 8)[::-1, ::-1, :]
+        np.copyto(self._digits.reshape(8, self._h // 8, self._w // 8), blocks.transpose(2, 0, 1))
+        self._display_digits(self._digits)
 
-        buf = list(buf)
-        for i in range(0, len(buf), step):
-            self.data(buf[i:i + step])
+    def _encode(self, pixels):
+        """
+        Packs a boolean pixel array into the per-digit register bytes of each
+        daisychained device: one row per digit, one column per device (the
+        farthest device first), bit ``y`` of each byte being the pixel row ``y``
+        of the digit column within the 8x8 block.
+        """
+        blocks = pixels.reshape(self._h // 8, 8, self._w // 8, 8)[::-1, :, ::-1, :]
+        blocks = blocks.transpose(3, 0, 2, 1).reshape(8, self.cascaded, 8)
+        return np.packbits(blocks, axis=-1, bitorder='little').reshape(8, self.cascaded)
+
+    def _display_digits(self, digits):
+        """
+        Sends the per-digit register bytes to the daisychained devices, one
+        SPI transaction per digit, skipping the digits that have not changed
+        since the last frame. The bytes are copied into preallocated buffers,
+        so the caller may reuse ``digits``.
+        """
+        if self._last_digits is None:
+            self._last_digits = np.empty((8, self.cascaded), dtype=np.uint8)
+            changed = range(8)
+        else:
+            changed = np.flatnonzero((digits != self._last_digits).any(axis=1))
+            if len(changed) == 0:
+                return
+        self._last_digits[...] = digits
+
+        self._buffer[:, :, 1] = digits
+        buf = self._buffer.reshape(8, 2 * self.cascaded)
+        for digit in changed:
+            self.data(buf[digit].tolist())
 
     def contrast(self, value):
         """
@@ -217,6 +279,8 @@ class ws2812(device):
         self.capabilities(width, height, rotate, mode="RGB")
         self._mapping = list(mapping or range(self.cascaded))
         assert(self.cascaded == len(self._mapping))
+        self._mapping_index = np.array(self._mapping, dtype=np.intp)
+        self._last_colors = None
         self._contrast = None
         self._prev_contrast = 0x70
 
@@ -267,19 +331,66 @@ class ws2812(device):
     def display(self, image):
         """
         Takes a 24-bit RGB :py:mod:`PIL.Image` and dumps it to the daisy-chained
-        WS2812 neopixels.
+        WS2812 neopixels. Only the LEDs whose colour has changed since the last
+        frame are set, and an unchanged frame is not rendered at all.
         """
         assert(image.mode == self.mode)
         assert(image.size == self.size)
 
+        self._display_colors(self._encode(np.asarray(image)))
+
+    def display_pixels(self, pixels):
+        """
+        Takes a NumPy array of RGB pixels, shaped ``(height, width, 3)``, and
+        dumps it to the daisy-chained WS2812 neopixels, without any
+        :py:mod:`PIL.Image` round trip.
+        """
+        pixels = np.asarray(pixels)
+        assert(pixels.shape == (self.height, self.width, 3))
+
+        self._display_colors(self._encode(pixels))
+
+    def clear(self):
+        """
+        Sets all the LEDs off.
+        """
+        self.display_pixels(np.zeros((self.height, self.width, 3), dtype=np.uint8))
+
+    def _display_colors(self, pixel_colors):
+        """
+        Sets the LEDs to 0xRRGGBB colours, given in pixel order. Only the LEDs
+        whose colour has changed since the last frame are set, and an unchanged
+        frame is not rendered at all.
+        """
+        # Colours by LED offset, as the LEDs are now, then as they should be
+        if self._last_colors is None:
+            colors = np.zeros(self.cascaded, dtype=np.uint32)
+            changed = np.unique(self._mapping_index)
+        else:
+            colors = self._last_colors.copy()
+        colors[self._mapping_index] = pixel_colors
+        if self._last_colors is not None:
+            changed = np.flatnonzero(colors != self._last_colors)
+        self._last_colors = colors
+
+        if len(changed) == 0:
+            return
+
+        # The rpi_ws281x binding has no bulk setter: one call per changed LED
         ws = self._ws
-        m = self._mapping
-        for idx, (red, green, blue) in enumerate(image.getdata()):
-            color = (red << 16) | (green << 8) | blue
-            ws.ws2811_led_set(self._channel, m[idx], color)
+        channel = self._channel
+        for led, color in zip(changed.tolist(), colors[changed].tolist()):
+            ws.ws2811_led_set(channel, led, color)
 
         self._flush()
 
+    def _encode(self, pixels):
+        """
+        Packs an array of RGB pixels into 0xRRGGBB colours, in pixel order.
+        """
+        pixels = pixels.astype(np.uint32).reshape(-1, 3)
+        return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+
     def show(self):
         """
         Simulates switching the display mode ON; this is achieved by restoring
@@ -400,6 +511,7 @@ class apa102(device):
         self.capabilities(width, height, rotate, mode="RGBA")
         self._mapping = list(mapping or range(self.cascaded))
         assert(self.cascaded == len(self._mapping))
+        self._mapping_index = np.array(self._mapping, dtype=np.intp)
         self._last_image = None
 
         self.contrast(0x70)
@@ -423,17 +535,15 @@ class apa102(device):
         # Send zeros to reset, then pixel values then zeros at end
         sz = image.width * image.height * 4
         buf = bytearray(sz * 3)
+        leds = np.frombuffer(buf, dtype=np.uint8)[sz:2 * sz].reshape(-1, 4)
 
-        m = self._mapping
-        for idx, (r, g, b, a) in enumerate(image.getdata()):
-            offset = sz + m[idx] * 4
-            brightness = (a >> 4) if a != 0xFF else self._brightness
-            buf[offset] = (0xE0 | brightness)
-            buf[offset + 1] = b
-            buf[offset + 2] = g
-            buf[offset + 3] = r
+        # Scatter each pixel (brightness, blue, green, red) to its LED offset
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 4)
+        alpha = pixels[:, 3]
+        brightness = np.where(alpha != 0xFF, alpha >> 4, self._brightness).astype(np.uint8)
+        leds[self._mapping_index] = np.column_stack((0xE0 | brightness, pixels[:, 2], pixels[:, 1], pixels[:, 0]))
 
-        self._serial_interface.data(list(buf))
+        self._serial_interface.data(buf)
 
     def show(self):
         """
@@ -460,6 +570,33 @@ class apa102(device):
             self.display(self._last_image)
 
 
+def _neosegment_position(char):
+    """
+    Converts a byte from std MAX7219 segment mappings to NeoSegment positions.
+    """
+    a = char >> 6 & 0x01
+    b = char >> 5 & 0x01
+    c = char >> 4 & 0x01
+    d = char >> 3 & 0x01
+    e = char >> 2 & 0x01
+    f = char >> 1 & 0x01
+    g = char >> 0 & 0x01
+
+    return \
+        b << 6 | \
+        a << 5 | \
+        f << 4 | \
+        g << 3 | \
+        c << 2 | \
+        d << 1 | \
+        e << 0
+
+
+# 256-entry translation table from std MAX7219 segment mappings to NeoSegment
+# positions, for bytes.translate
+_NEOSEGMENT_POSITIONS = bytes(_neosegment_position(char) for char in range(256))
+
+
 class neosegment(sevensegment):
     """
     Extends the :py:class:`~luma.core.virtual.sevensegment` class specifically
@@ -510,34 +647,26 @@ class neosegment(sevensegment):
             raise OverflowError(
                 "Device's capabilities insufficient for value '{0}'".format(text))
 
-        with canvas(self.device) as draw:
-            for x, byte in enumerate(data):
-                for y in range(self.device.height):
-                    if byte & 0x01:
-                        draw.point((x, y), fill=color[x])
-                    byte >>= 1
+        # Fill the frame directly: bit y of byte x lights pixel (x, y) in the
+        # colour of character x
+        mode = self.device.mode
+        height = min(self.device.height, 8)
+        lit = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8)[:, np.newaxis], axis=1, bitorder='little')
+        colors = [ImageColor.getcolor(c, mode) if isinstance(c, str) else c for c in color]
+        colors = np.array(colors, dtype=np.uint8).reshape(len(color), -1)
+        frame = np.zeros((self.device.height, self.device.width, colors.shape[1]), dtype=np.uint8)
+        frame[:height] = np.where(lit[:, :height].T[:, :, np.newaxis], colors[np.newaxis, :, :], 0)
+
+        if hasattr(self.device, 'display_pixels'):
+            self.device.display_pixels(frame)
+        else:
+            self.device.display(Image.fromarray(frame.squeeze(axis=2) if colors.shape[1] == 1 else frame, mode))
 
     def segment_mapper(self, text, notfound="_"):
-        for char in regular(text, notfound):
-
-            # Convert from std MAX7219 segment mappings
-            a = char >> 6 & 0x01
-            b = char >> 5 & 0x01
-            c = char >> 4 & 0x01
-            d = char >> 3 & 0x01
-            e = char >> 2 & 0x01
-            f = char >> 1 & 0x01
-            g = char >> 0 & 0x01
-
-            # To NeoSegment positions
-            yield \
-                b << 6 | \
-                a << 5 | \
-                f << 4 | \
-                g << 3 | \
-                c << 2 | \
-                d << 1 | \
-                e << 0
+        # Convert from std MAX7219 segment mappings to NeoSegment positions,
+        # through the translation table
+        for char in bytes(regular(text, notfound)).translate(_NEOSEGMENT_POSITIONS):
+            yield char
 
 
 class unicornhathd(device):
@@ -579,19 +708,16 @@ class unicornhathd(device):
         assert(image.size == self.size)
         self._last_image = image.copy()
 
-        # Send zeros to reset, then pixel values then zeros at end
-        sz = image.width * image.height * 3
-        buf = bytearray(sz)
-        normalized_brightness = self._brightness / 255.0
-
-        for idx, (r, g, b, a) in enumerate(image.getdata()):
-            offset = idx * 3
-            brightness = a / 255.0 if a != 255 else normalized_brightness
-            buf[offset] = int(r * brightness)
-            buf[offset + 1] = int(g * brightness)
-            buf[offset + 2] = int(b * brightness)
-
-        self._serial_interface.data([0x72] + list(buf))   # 0x72 == SOF ... start of frame?
+        # Start of frame, then pixel values (RGB scaled by alpha, or by the
+        # contrast if fully opaque), truncated as int() would
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 4)
+        alpha = pixels[:, 3]
+        brightness = np.where(alpha != 255, alpha / 255.0, self._brightness / 255.0)
+        buf = bytearray(1 + pixels.shape[0] * 3)
+        buf[0] = 0x72   # 0x72 == SOF ... start of frame?
+        np.frombuffer(buf, dtype=np.uint8)[1:].reshape(-1, 3)[:] = pixels[:, :3] * brightness[:, np.newaxis]
+
+        self._serial_interface.data(buf)
 
     def show(self):
         """
@@ -2,6 +2,8 @@
 # Copyright (c) 2017-18 Richard Hull and contributors
 # See LICENSE.rst for details.
 
+from functools import lru_cache
+
 _DIGITS = {
     ' ': 0x00,
     '!': 0xa0,
@@ -103,6 +105,40 @@ _DIGITS = {
 
 
 def regular(text, notfound="_"):
+    encoded = _encode_cached(_regular, text, notfound)
+    if encoded is None:
+        encoded = _regular(text, notfound)
+    for digit in encoded:
+        yield digit
+
+
+def dot_muncher(text, notfound="_"):
+    encoded = _encode_cached(_dot_muncher, text, notfound)
+    if encoded is None:
+        encoded = _dot_muncher(text, notfound)
+    for digit in encoded:
+        yield digit
+
+
+def _encode_cached(mapper, text, notfound):
+    """
+    Encodes text through a segment mapper, caching the encoded bytes of the
+    most recently used strings (text is usually a short, often repeated,
+    numeric value). Returns ``None`` if text is not made of strings.
+    """
+    try:
+        text = text if isinstance(text, str) else "".join(text)
+    except TypeError:
+        return None
+    return _encoded(mapper, text, notfound)
+
+
+@lru_cache(maxsize=256)
+def _encoded(mapper, text, notfound):
+    return bytes(mapper(text, notfound))
+
+
+def _regular(text, notfound):
     undefined = _DIGITS[notfound] if notfound is not None else None
     for char in iter(text):
         digit = _DIGITS.get(char, undefined)
@@ -110,7 +146,7 @@ def regular(text, notfound="_"):
             yield digit
 
 
-def dot_muncher(text, notfound="_"):
+def _dot_muncher(text, notfound):
     if not text:
         return
 
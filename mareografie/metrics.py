@@ -0,0 +1,238 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Lightweight instrumentation of the ingest → draw pipeline: counters, gauges and histograms (of timings, in seconds),
+# exported as Prometheus-style text — on a local HTTP endpoint — or as a periodic JSON log line.
+#
+# Instrumentation is disabled by default: until enable_metrics is called, timed returns a shared no-op context
+# manager, and the other functions return at once, so that instrumented hot paths cost next to nothing.
+# Metrics are kept by name:
+# {
+#   'sparql_request_seconds': {'type': 'histogram', 'buckets': [...], 'counts': [...], 'sum': 1.27, 'count': 3},
+#   'frames_total': {'type': 'counter', 'value': 7200},
+#   'level_queue_depth': {'type': 'gauge', 'value': 0},
+#   'data_staleness_seconds': {'type': 'gauge', 'value': 742.0},
+#   ...
+# }
+
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metric name prefix.
+PREFIX = 'mareografie_'
+
+# Histogram buckets (upper bounds, in seconds): from the sub-millisecond SPI writes to the slow SPARQL requests.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Whether instrumentation is enabled.
+enabled = False
+
+# Metrics, by name.
+metrics = {}
+
+metrics_lock = threading.Lock()
+
+# Shared no-op context manager, returned by timed when instrumentation is disabled.
+disabled_timer = contextlib.nullcontext()
+
+# Context manager observing the time spent in its block in a histogram.
+class timer(object):
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+# Serial interface observing the time spent in its transactions (SPI writes) in a histogram, wrapping another one.
+class timed_serial(object):
+
+    def __init__(self, serial, name='spi_write_seconds'):
+        self._serial = serial
+        self._name = name
+
+    def command(self, *cmd):
+        with timed(self._name):
+            self._serial.command(*cmd)
+
+    def data(self, data):
+        with timed(self._name):
+            self._serial.data(data)
+
+    def __getattr__(self, name):
+        return getattr(self._serial, name)
+
+# Enables instrumentation.
+def enable_metrics():
+
+    global enabled
+    enabled = True
+
+# Times a block, observing the elapsed time (in seconds) in a histogram, like:
+# with timed('sparql_request_seconds'):
+#     ...
+#
+# Args:
+# name: the histogram name.
+#
+# Returns: the context manager.
+def timed(name):
+
+    if not enabled:
+        return disabled_timer
+
+    return timer(name)
+
+# Increments a counter.
+#
+# Args:
+# name: the counter name.
+# value: the increment, defaulting to 1.
+def increment_counter(name, value=1):
+
+    if not enabled:
+        return
+
+    with metrics_lock:
+        metric = metrics.setdefault(name, {'type': 'counter', 'value': 0})
+        metric['value'] += value
+
+# Sets a gauge.
+#
+# Args:
+# name: the gauge name.
+# value: the value.
+def set_gauge(name, value):
+
+    if not enabled:
+        return
+
+    with metrics_lock:
+        metrics.setdefault(name, {'type': 'gauge', 'value': 0})['value'] = value
+
+# Observes a value in a histogram.
+#
+# Args:
+# name: the histogram name.
+# value: the value (e.g. a time, in seconds).
+def observe(name, value):
+
+    if not enabled:
+        return
+
+    with metrics_lock:
+        metric = metrics.get(name)
+        if metric is None:
+            metric = metrics[name] = {'type': 'histogram', 'buckets': BUCKETS, 'counts': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        metric['counts'][bisect.bisect_left(metric['buckets'], value)] += 1
+        metric['sum'] += value
+        metric['count'] += 1
+
+# Gets a snapshot of the metrics.
+#
+# Returns: the metrics, as a dictionary by name (histograms summarized by count, sum and mean), like
+# {'sparql_request_seconds': {'count': 3, 'sum': 1.27, 'mean': 0.423}, 'frames_total': 7200, 'level_queue_depth': 0}.
+def get_metrics():
+
+    snapshot = {}
+    with metrics_lock:
+        for name, metric in sorted(metrics.items()):
+            if metric['type'] == 'histogram':
+                snapshot[name] = {'count': metric['count'], 'sum': metric['sum'], 'mean': metric['sum'] / metric['count'] if metric['count'] else None}
+            else:
+                snapshot[name] = metric['value']
+
+    return snapshot
+
+# Formats the metrics as Prometheus-style text (exposition format 0.0.4).
+#
+# Returns: the metrics, as text.
+def format_metrics():
+
+    lines = []
+    with metrics_lock:
+        for name, metric in sorted(metrics.items()):
+            name = PREFIX + name
+            lines.append('# TYPE ' + name + ' ' + metric['type'])
+            if metric['type'] == 'histogram':
+                cumulative_count = 0
+                for bucket, count in zip(metric['buckets'] + (float('inf'), ), metric['counts']):
+                    cumulative_count += count
+                    lines.append(name + '_bucket{le="' + ('+Inf' if bucket == float('inf') else repr(bucket)) + '"} ' + str(cumulative_count))
+                lines.append(name + '_sum ' + repr(metric['sum']))
+                lines.append(name + '_count ' + str(metric['count']))
+            else:
+                lines.append(name + ' ' + repr(metric['value']))
+
+    return '\n'.join(lines) + '\n'
+
+# HTTP request handler serving the metrics as Prometheus-style text, on /metrics.
+class metrics_request_handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        content = format_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format % args)
+
+# Serves the metrics on a local Prometheus-style text endpoint (http://host:port/metrics), in background.
+#
+# Args:
+# port: the port.
+# host: the host, defaulting to localhost only.
+#
+# Returns: the HTTP server.
+def serve_metrics(port, host='127.0.0.1'):
+
+    logger = logging.getLogger(__name__)
+
+    server = ThreadingHTTPServer((host, port), metrics_request_handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info('Serving metrics on http://' + host + ':' + str(server.server_address[1]) + '/metrics')
+
+    return server
+
+# Logs the metrics as a JSON line, periodically, in background, until stopped.
+#
+# Args:
+# period: the period (in seconds).
+# stop: the event stopping the logging.
+#
+# Returns: the logging thread.
+def log_metrics_periodically(period, stop):
+
+    logger = logging.getLogger(__name__)
+
+    def log_metrics():
+        while not stop.wait(period):
+            logger.info(json.dumps(get_metrics(), sort_keys=True))
+
+    thread = threading.Thread(target=log_metrics, daemon=True)
+    thread.start()
+
+    return thread
+
+# --------------------------------------------------
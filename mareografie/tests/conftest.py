@@ -0,0 +1,51 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Test configuration: the mareografie modules are imported like when_above does (from the mareografie directory),
+# and the local cache lives in a scratch directory, never in the user's one, removed at the end of the test run.
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cache in a scratch directory: set before importing the ISPRA RMN services, which read it on import (as the
+# default of their cache_directory arguments, so it cannot be a fixture).
+CACHE_DIRECTORY = tempfile.mkdtemp(prefix='mareografie-tests-')
+os.environ['MAREOGRAFIE_CACHE_DIRECTORY'] = CACHE_DIRECTORY
+
+from ispra_rmn import ispra_rmn_services, sparql_client
+from ispra_rmn.ispra_rmn_stand_in import serve_stand_in, stop_stand_in
+
+# Serves a local ISPRA stand-in (see ispra_rmn_stand_in), with no fixtures yet, from a cold start — empty cache, no
+# in-memory state — and points the ISPRA RMN services to it.
+@pytest.fixture
+def ispra_stand_in():
+
+    shutil.rmtree(CACHE_DIRECTORY, ignore_errors=True)
+    sparql_client.cached_responses.clear()
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+
+    server = serve_stand_in({})
+    service = ispra_rmn_services.SPARQL_SERVICE
+    ispra_rmn_services.SPARQL_SERVICE = server.base_url + '/sparql'
+    yield server
+    ispra_rmn_services.SPARQL_SERVICE = service
+    stop_stand_in(server)
+
+# Removes the scratch cache directory, at the end of the test run.
+#
+# Args:
+# config: the pytest configuration.
+def pytest_unconfigure(config):
+
+    shutil.rmtree(CACHE_DIRECTORY, ignore_errors=True)
+
+# --------------------------------------------------
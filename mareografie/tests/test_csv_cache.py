@@ -0,0 +1,69 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Tests of the local on-disk cache of the monthly distributions.
+
+from datetime import datetime, timedelta, timezone
+
+from ispra_rmn import csv_cache
+from ispra_rmn.csv_cache import get_cached_csv, is_closed
+from ispra_rmn.ispra_rmn_stand_in import STATION, get_fixture_path
+
+# Fixture open month: the current one (in UTC).
+PERIOD = datetime.now(timezone.utc).strftime('%Y-%m')
+
+# Gets the cached content of a monthly distribution, through the local cache.
+#
+# Args:
+# server: the ISPRA stand-in.
+# period: the monthly period, formatted as '%Y-%m'.
+#
+# Returns: the cached monthly distribution, as bytes.
+def get_cached_content(server, period):
+
+    with open(get_cached_csv(STATION, period, server.base_url + get_fixture_path(period)), 'rb') as csv_file:
+        return csv_file.read()
+
+def test_months_are_closed_after_the_grace_period_in_utc():
+
+    end = datetime(2020, 6, 1, tzinfo=timezone.utc)
+    grace = timedelta(seconds=csv_cache.CLOSED_MONTH_GRACE)
+
+    # Just after local midnight on the 1st in Italy (UTC+2), the month has not even ended in UTC.
+    assert not is_closed('2020-05', datetime(2020, 6, 1, 0, 30, tzinfo=timezone(timedelta(hours=2))))
+    assert not is_closed('2020-05', end + grace - timedelta(seconds=1))
+    assert is_closed('2020-05', end + grace)
+    assert is_closed('2019-12', datetime(2020, 1, 1, tzinfo=timezone.utc) + grace)
+    assert not is_closed('2020-06', end + grace)
+
+def test_open_months_are_revalidated(ispra_stand_in):
+
+    ispra_stand_in.fixtures[PERIOD] = b'utc;level\n2020-05-01 00:00:00;25.0\n'
+    assert get_cached_content(ispra_stand_in, PERIOD) == ispra_stand_in.fixtures[PERIOD]
+    assert get_cached_content(ispra_stand_in, PERIOD) == ispra_stand_in.fixtures[PERIOD]
+
+    ispra_stand_in.fixtures[PERIOD] += b'2020-05-01 00:10:00;22.4\n'
+    assert get_cached_content(ispra_stand_in, PERIOD) == ispra_stand_in.fixtures[PERIOD]
+    assert ispra_stand_in.requests[get_fixture_path(PERIOD)] == 3
+
+def test_rewritten_months_are_never_spliced(ispra_stand_in):
+
+    ispra_stand_in.fixtures[PERIOD] = b'utc;level\n2020-05-01 00:00:00;25.0\n'
+    get_cached_content(ispra_stand_in, PERIOD)
+
+    # Corrected samples, re-exported: the cached bytes are not a prefix of the new ones.
+    ispra_stand_in.fixtures[PERIOD] = b'utc;level\n2020-05-01 00:00:00;21.0\n2020-05-01 00:10:00;22.4\n'
+    assert get_cached_content(ispra_stand_in, PERIOD) == ispra_stand_in.fixtures[PERIOD]
+
+def test_closed_months_are_immutable(ispra_stand_in):
+
+    ispra_stand_in.fixtures['2019-05'] = b'utc;level\n2019-05-01 00:00:00;25.0\n'
+    get_cached_content(ispra_stand_in, '2019-05')
+
+    ispra_stand_in.fixtures['2019-05'] += b'2019-05-01 00:10:00;22.4\n'
+    assert get_cached_content(ispra_stand_in, '2019-05') == b'utc;level\n2019-05-01 00:00:00;25.0\n'
+    assert ispra_stand_in.requests[get_fixture_path('2019-05')] == 1
+
+# --------------------------------------------------
@@ -0,0 +1,90 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Tests of the streaming reader of the monthly distributions, backwards from their end, against pandas.
+
+import io
+
+import numpy as np
+import pandas
+import pytest
+
+from ispra_rmn import csv_reader
+from ispra_rmn.csv_reader import read_hydrometric_csv, read_latest_hydrometric_sample
+
+# Time of the first fixture row, 2019-05-01 00:00:00, in seconds since the epoch.
+START = 1556668800
+
+# Writes a fixture monthly distribution.
+#
+# Args:
+# tmp_path: the temporary directory.
+# content: the monthly distribution, as bytes.
+#
+# Returns: the path of the monthly distribution.
+def write_csv(tmp_path, content):
+
+    path = tmp_path / 'hydrometric.2019-05.csv'
+    path.write_bytes(content)
+
+    return str(path)
+
+# Rows span many blocks, and rows cross block boundaries, whatever the block size.
+@pytest.mark.parametrize('block_size', [16, 100, csv_reader.BLOCK_SIZE])
+def test_rows_are_read_like_pandas(tmp_path, monkeypatch, block_size):
+
+    monkeypatch.setattr(csv_reader, 'BLOCK_SIZE', block_size)
+    utc = START + 600 * np.arange(1000)
+    level = np.round(np.random.default_rng(0).normal(25, 10, utc.size), 1)
+    timestamps = [str(timestamp).replace('T', ' ') for timestamp in utc.astype('datetime64[s]')]
+    content = ('utc;level\n' + ''.join(timestamp + ';' + str(value) + '\n' for timestamp, value in zip(timestamps, level))).encode('utf-8')
+
+    expected = pandas.read_csv(io.BytesIO(content), sep=';', header=0, names=['utc', 'level'])
+    read_utc, read_level = read_hydrometric_csv(write_csv(tmp_path, content))
+
+    np.testing.assert_array_equal(read_utc, pandas.to_datetime(expected['utc']).values.astype('datetime64[s]').astype(np.int64))
+    np.testing.assert_array_equal(read_level, expected['level'].values)
+
+@pytest.mark.parametrize('block_size', [16, csv_reader.BLOCK_SIZE])
+def test_malformed_rows_are_skipped(tmp_path, monkeypatch, block_size):
+
+    monkeypatch.setattr(csv_reader, 'BLOCK_SIZE', block_size)
+    content = (b'utc;level\n'
+               b'2019-05-01 00:00:00;25.0\n'
+               b'2019-05-01 00:10:00;22.4\n'
+               b'\n'
+               b'not a row\n'
+               b'2019-05-01 00:20:00;nan\n'
+               b'"2019-05-01 00:30:00";24.3\n'
+               b'2019-02-30 00:40:00;1.0\n'
+               b'2019-05-01 00:50:00;26.3')
+
+    utc, level = read_hydrometric_csv(write_csv(tmp_path, content))
+
+    np.testing.assert_array_equal(utc, START + np.array([0, 600, 1800, 3000]))
+    np.testing.assert_array_equal(level, [25.0, 22.4, 24.3, 26.3])
+
+def test_reading_stops_at_the_latest_known_sample(tmp_path):
+
+    path = write_csv(tmp_path, b'utc;level\n2019-05-01 00:00:00;25.0\n2019-05-01 00:10:00;22.4\n2019-05-01 00:20:00;26.3\n')
+
+    utc, level = read_hydrometric_csv(path, newer_than=START + 600)
+    np.testing.assert_array_equal(utc, [START + 1200])
+    np.testing.assert_array_equal(level, [26.3])
+
+    utc, _ = read_hydrometric_csv(path, newer_than=START + 1200)
+    assert utc.size == 0
+
+    utc, _ = read_hydrometric_csv(path, limit=2)
+    np.testing.assert_array_equal(utc, [START + 600, START + 1200])
+
+    assert read_latest_hydrometric_sample(path) == (START + 1200, 26.3)
+
+def test_no_latest_sample_without_rows(tmp_path):
+
+    assert read_latest_hydrometric_sample(write_csv(tmp_path, b'utc;level\n')) is None
+    assert read_latest_hydrometric_sample(write_csv(tmp_path, b'')) is None
+
+# --------------------------------------------------
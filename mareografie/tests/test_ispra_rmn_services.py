@@ -0,0 +1,227 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Tests of the ISPRA RMN services, against a local HTTP stand-in of the ISPRA service (see ispra_rmn_stand_in):
+# the concurrent download of the monthly distributions — served after an artificial latency, longer for the older
+# months, so that downloads complete out of period order — the incremental ingest, and the warm start.
+
+import io
+import time
+import urllib.error
+
+import numpy as np
+import pandas
+import pytest
+
+from ispra_rmn import http_pool, ispra_rmn_services
+from ispra_rmn.ispra_rmn_services import (get_discretized_hydrometric_level_nearby, get_hydrometric_level_distribution, get_hydrometric_level_nearby,
+                                          get_latest_sample_time_nearby)
+from ispra_rmn.ispra_rmn_stand_in import NEARBY, get_fixture_path
+from ispra_rmn.level_state import read_warm_start_state, write_warm_start_state
+
+# Fixture periods (closed months), in period order.
+PERIODS = ['2019-0' + str(month) for month in range(1, 10)] + ['2019-10', '2019-11', '2019-12']
+
+# Gets the fixture monthly distribution (CSV file) of a monthly period: a few rows, with levels telling the period apart.
+#
+# Args:
+# period: the monthly period, formatted as '%Y-%m'.
+#
+# Returns: the monthly distribution, as bytes.
+def get_fixture_csv(period):
+
+    month = int(period[5:])
+    rows = [period + '-01 00:' + str(minutes) + '0:00;' + str(month) + '.' + str(minutes) for minutes in range(3)]
+
+    return ('utc;level\n' + '\n'.join(rows) + '\n').encode('utf-8')
+
+# Serves the fixtures on the ISPRA stand-in, with the older months slower than the newer ones.
+@pytest.fixture
+def stand_in(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update({period: get_fixture_csv(period) for period in PERIODS})
+    ispra_stand_in.latencies.update({get_fixture_path(period): 0.05 * (len(PERIODS) - index) for index, period in enumerate(PERIODS)})
+
+    return ispra_stand_in
+
+# Gets a fixture monthly distribution (CSV file) from typed columns.
+#
+# Args:
+# utc: the utc column, in seconds since the epoch.
+# level: the level column.
+# header: if true, starts with the header row, defaulting to true.
+#
+# Returns: the monthly distribution, as bytes.
+def get_csv(utc, level, header=True):
+
+    rows = [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(sample_time)) + ';' + str(value) + '\n' for sample_time, value in zip(utc, level)]
+
+    return (('utc;level\n' if header else '') + ''.join(rows)).encode('utf-8')
+
+# Gets recent fixture monthly distributions: the months of the last year (in UTC) up to the current one, with a sample
+# every 6 hours until a day ago, and pseudo-random levels.
+#
+# Returns: the monthly distributions, as bytes, by monthly period.
+def get_recent_fixtures():
+
+    end = int(time.time()) - 60*60*24
+    utc = np.arange(end - 60*60*24*400, end, 60*60*6)
+    level = np.round(np.random.default_rng(0).normal(25, 10, utc.size), 1)
+    periods = np.array([time.strftime('%Y-%m', time.gmtime(sample_time)) for sample_time in utc])
+    fixtures = {period: get_csv(utc[periods == period], level[periods == period]) for period in np.unique(periods)}
+    fixtures.setdefault(time.strftime('%Y-%m', time.gmtime()), get_csv([], []))
+
+    return fixtures
+
+# Gets the quantile bin (from 1 to cuts) of the latest level, like pandas.qcut.
+#
+# Args:
+# level: the levels, in time order.
+# cuts: the quantile cuts.
+#
+# Returns: the quantile bin of the latest level.
+def get_expected_bin(level, cuts):
+
+    return int(pandas.qcut(np.asarray(level, dtype=np.float64), q=cuts, labels=False)[-1]) + 1
+
+# Gets the expected distribution: the fixture monthly distributions, parsed one after another, in period order.
+def get_expected_distribution():
+
+    monthly_distributions = [pandas.read_csv(io.BytesIO(get_fixture_csv(period)), sep=';', header=0, names=['utc', 'level']) for period in PERIODS]
+
+    return pandas.concat(monthly_distributions, ignore_index=True)
+
+def test_distribution_is_concatenated_in_period_order(stand_in):
+
+    distribution = get_hydrometric_level_distribution(NEARBY, PERIODS[0])
+
+    pandas.testing.assert_frame_equal(distribution, get_expected_distribution())
+
+def test_concurrency_stays_at_max_connections(stand_in, monkeypatch):
+
+    monkeypatch.setattr(http_pool, 'MAX_CONNECTIONS', 3)
+
+    get_hydrometric_level_distribution(NEARBY, PERIODS[0])
+
+    assert stand_in.max_in_flight == http_pool.MAX_CONNECTIONS
+
+def test_server_errors_are_retried_with_backoff(stand_in, monkeypatch):
+
+    backoffs = []
+    monkeypatch.setattr(http_pool.time, 'sleep', backoffs.append)
+    stand_in.failures[get_fixture_path(PERIODS[4])] = 2
+
+    distribution = get_hydrometric_level_distribution(NEARBY, PERIODS[0])
+
+    pandas.testing.assert_frame_equal(distribution, get_expected_distribution())
+    assert stand_in.requests[get_fixture_path(PERIODS[4])] == 3
+    assert backoffs == [http_pool.BACKOFF, 2 * http_pool.BACKOFF]
+
+def test_server_errors_are_raised_after_the_retries(stand_in, monkeypatch):
+
+    monkeypatch.setattr(http_pool.time, 'sleep', lambda seconds: None)
+    stand_in.failures[get_fixture_path(PERIODS[4])] = http_pool.RETRIES + 1
+
+    with pytest.raises(urllib.error.HTTPError):
+        get_hydrometric_level_distribution(NEARBY, PERIODS[0])
+    assert stand_in.requests[get_fixture_path(PERIODS[4])] == http_pool.RETRIES + 1
+
+def test_stalled_requests_time_out_and_are_retried(stand_in, monkeypatch):
+
+    monkeypatch.setattr(http_pool.time, 'sleep', lambda seconds: None)
+    path = get_fixture_path(PERIODS[0])
+    stand_in.latencies[path] = 5
+
+    with pytest.raises(urllib.error.URLError):
+        http_pool.fetch(stand_in.base_url + path, timeout=0.2, retries=1)
+    assert stand_in.requests[path] == 2
+
+    # A stalled request does not break the following ones.
+    stand_in.latencies[path] = 0
+    status, _, content = http_pool.fetch(stand_in.base_url + path, timeout=0.2, retries=1)
+    assert status == 200
+    assert content == get_fixture_csv(PERIODS[0])
+
+def test_incremental_refresh_reads_the_rows_cached_by_another_caller(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update(get_recent_fixtures())
+    get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+    latest_time = get_latest_sample_time_nearby(NEARBY)
+
+    # New samples are published, and pulled into the local cache by another caller before the next refresh.
+    utc = latest_time + 600 * np.arange(1, 4)
+    period = max(ispra_stand_in.fixtures)
+    ispra_stand_in.fixtures[period] = ispra_stand_in.fixtures[period] + get_csv(utc, [99.1, 99.2, 99.3], header=False)
+    get_hydrometric_level_nearby(NEARBY)
+    level = get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+
+    window = ispra_rmn_services.quantile_windows[NEARBY]
+    assert get_latest_sample_time_nearby(NEARBY) == utc[-1]
+    np.testing.assert_array_equal(window['utc'][-3:], utc)
+    assert level == get_expected_bin(window['level'], 8) == 8
+
+def test_warm_start_level_on_an_edge_is_in_the_lower_bin(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update(get_recent_fixtures())
+    get_discretized_hydrometric_level_nearby(NEARBY, 4, incremental=True)
+
+    # Quantile edges got from the columnar store (float32 levels), one of them on 12.2.
+    state = read_warm_start_state(NEARBY)
+    edges = [0.0, 10.0, float(np.float32(12.2)), 20.0, 50.0]
+    write_warm_start_state(NEARBY, state['level'], 4, edges, time.time(), state['latest_sample_time'], state['etags'])
+
+    # Restart, and resume from the warm-start snapshot, with a new sample on the edge, parsed from the CSV file.
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+    period = max(ispra_stand_in.fixtures)
+    ispra_stand_in.fixtures[period] = ispra_stand_in.fixtures[period] + get_csv([state['latest_sample_time'] + 600], [12.2], header=False)
+
+    assert get_discretized_hydrometric_level_nearby(NEARBY, 4, incremental=True) == 2
+    assert NEARBY in ispra_rmn_services.warm_start_states
+
+def test_restart_resumes_from_the_warm_start_snapshot(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update(get_recent_fixtures())
+    level = get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+    latest_time = get_latest_sample_time_nearby(NEARBY)
+
+    # Restart: only the month of the latest sample is revalidated, and the quantile window is not built again.
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+    ispra_stand_in.requests.clear()
+
+    assert get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True) == level
+    assert get_latest_sample_time_nearby(NEARBY) == latest_time
+    assert NEARBY not in ispra_rmn_services.quantile_windows
+    assert set(ispra_stand_in.requests) - {'/sparql'} <= {get_fixture_path(period) for period in ispra_stand_in.fixtures if period >= time.strftime('%Y-%m', time.gmtime(latest_time))}
+
+def test_warm_start_is_skipped_if_the_cache_has_changed(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update(get_recent_fixtures())
+    get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+
+    # The month of the latest sample is re-exported, and downloaded again by another caller, before the restart.
+    period = time.strftime('%Y-%m', time.gmtime(get_latest_sample_time_nearby(NEARBY)))
+    ispra_stand_in.fixtures[period] = ispra_stand_in.fixtures[period].replace(b';', b';1')
+    get_hydrometric_level_nearby(NEARBY)
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+
+    level = get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+
+    window = ispra_rmn_services.quantile_windows[NEARBY]
+    assert level == get_expected_bin(window['level'], 8)
+
+def test_exact_mode_skips_the_warm_start(ispra_stand_in):
+
+    ispra_stand_in.fixtures.update(get_recent_fixtures())
+    level = get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True)
+    ispra_rmn_services.quantile_windows.clear()
+    ispra_rmn_services.warm_start_states.clear()
+
+    assert get_discretized_hydrometric_level_nearby(NEARBY, 8, incremental=True, exact=True) == level
+    assert NEARBY in ispra_rmn_services.quantile_windows
+
+# --------------------------------------------------
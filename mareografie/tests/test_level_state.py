@@ -0,0 +1,29 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Tests of the warm-start snapshot of the ISPRA hydrometric ingest.
+
+import json
+
+from ispra_rmn.level_state import read_level_state, read_warm_start_state, write_warm_start_state
+
+def test_levels_with_other_cuts_are_ignored(tmp_path):
+
+    path = str(tmp_path / 'state.json')
+    write_warm_start_state('Bari', 8, 8, range(9), 0, 1590969000, {}, path)
+    write_warm_start_state('Venezia', 3, 4, range(5), 0, 1590969000, {}, path)
+
+    assert read_level_state(['Bari', 'Venezia'], 8, path) == {'Bari': 8}
+    assert read_level_state(['Bari', 'Venezia'], 4, path) == {'Venezia': 3}
+
+def test_snapshots_without_cuts_are_ignored(tmp_path):
+
+    path = tmp_path / 'state.json'
+    path.write_text(json.dumps({'Bari': {'level': 8, 'time': 0, 'edges': list(range(9)), 'edges_time': 0, 'latest_sample_time': 1590969000, 'etags': {}}}))
+
+    assert read_level_state(['Bari'], 8, str(path)) == {}
+    assert read_warm_start_state('Bari', str(path)) is None
+
+# --------------------------------------------------
@@ -0,0 +1,88 @@
+# --------------------------------------------------
+# Copyright (C) 2020 Antonio Viesti (a.viesti@eutropia.it).
+# Creative Commons CC BY (https://creativecommons.org/licenses/by/4.0/)
+# --------------------------------------------------
+
+# Tests of the exact sliding-window quantiles, against pandas.qcut.
+
+import numpy as np
+import pandas
+import pytest
+
+from ispra_rmn.quantile_window import (create_quantile_window, discretize_levels, get_distribution_edges, get_latest_quantile_bin, get_quantile_edges,
+                                       update_quantile_window)
+
+# Gets the quantile bin (from 1 to cuts) of the latest level, like pandas.qcut.
+#
+# Args:
+# level: the levels, in time order.
+# cuts: the quantile cuts.
+#
+# Returns: the quantile bin of the latest level.
+def get_expected_bin(level, cuts):
+
+    return int(pandas.qcut(np.asarray(level, dtype=np.float64), q=cuts, labels=False)[-1]) + 1
+
+def test_latest_level_on_an_edge_is_in_the_lower_bin_whatever_its_dtype():
+
+    # 17 levels over 8 cuts: every other sorted level is an edge, the latest one (12.2) included.
+    level = np.array([1, 2, 3, 4, 12.2, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 12.2])
+    utc = 600 * np.arange(level.size)
+
+    # Seeded from the columnar store (float32), and updated from the CSV reader (float64).
+    window = create_quantile_window()
+    update_quantile_window(window, utc[:-1], level[:-1].astype(np.float32))
+    update_quantile_window(window, utc[-1:], level[-1:])
+
+    assert get_latest_quantile_bin(window, 8) == get_expected_bin(level.astype(np.float32), 8) == 2
+
+def test_sliding_window_matches_qcut():
+
+    # Levels rounded like the ISPRA ones, with many ties, fed in chunks of random sizes, expiring as the window slides.
+    generator = np.random.default_rng(0)
+    utc = 600 * np.arange(3000)
+    level = np.round(generator.normal(25, 10, utc.size), 1).astype(np.float32)
+    window = create_quantile_window(span=600 * 500)
+
+    start = 0
+    while start < utc.size:
+        end = min(start + int(generator.integers(1, 60)), utc.size)
+        update_quantile_window(window, utc[start:end], level[start:end])
+        start = end
+
+        expected_level = level[:end][utc[:end] >= utc[end - 1] - window['span']]
+        np.testing.assert_array_equal(window['level'], expected_level)
+        np.testing.assert_array_equal(window['sorted_level'], np.sort(expected_level))
+        np.testing.assert_array_equal(get_quantile_edges(window, 8), np.quantile(expected_level.astype(np.float64), np.linspace(0, 1, 9)))
+        assert get_latest_quantile_bin(window, 8) == get_expected_bin(expected_level, 8)
+
+def test_older_samples_are_ignored():
+
+    window = create_quantile_window()
+    update_quantile_window(window, [0, 600, 1200], [1.0, 2.0, 3.0])
+    update_quantile_window(window, [600, 1200, 1800], [9.0, 9.0, 4.0])
+
+    np.testing.assert_array_equal(window['utc'], [0, 600, 1200, 1800])
+    np.testing.assert_array_equal(window['level'], [1.0, 2.0, 3.0, 4.0])
+
+def test_distribution_is_discretized_like_qcut():
+
+    level = np.round(np.random.default_rng(1).normal(25, 10, 5000), 1).astype(np.float32)
+
+    edges = get_distribution_edges(level, 8)
+
+    np.testing.assert_array_equal(edges, np.quantile(level.astype(np.float64), np.linspace(0, 1, 9)))
+    np.testing.assert_array_equal(discretize_levels(level, edges), pandas.qcut(level.astype(np.float64), q=8, labels=False) + 1)
+
+def test_duplicate_edges_are_raised_like_qcut():
+
+    level = np.array([1.0] * 90 + list(range(10)))
+
+    with pytest.raises(ValueError):
+        pandas.qcut(level, q=8)
+    with pytest.raises(ValueError):
+        get_distribution_edges(level, 8)
+    with pytest.raises(ValueError):
+        get_distribution_edges([], 8)
+
+# --------------------------------------------------
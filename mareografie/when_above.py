@@ -6,6 +6,7 @@
 # Mareografie (1) — When above — Alta e bassa marea.
 #
 # «Mareografie (1) — When above» gets the current sea level value nearby Italian sea towns, and draws it on a 8X8 LED panel, iteratively.
+# Many towns can be drawn at once on a cascaded LED panel, one 8X8 block per town.
 # A tide gauge — also known as mareograph, marigraph, sea-level recorder, or limnimeter — is a device for measuring the change in sea level (hydrometric_level).
 # The Italian ISPRA National Tidegauge Network is composed of 36 monitoring stations — powered by solar panels — located in:
 # Ancona
@@ -47,68 +48,215 @@
 # Vieste
 
 import logging
+import multiprocessing
+import signal
 import time
-from queue import Queue
-from threading import Thread
+from queue import Empty, Queue
+from threading import Event, Thread
 
-from ispra_rmn.ispra_rmn_services import get_discretized_hydrometric_level_nearby
-from led_panel.led_panel_drawings import draw_level, get_device_in_default_configuration
+from ispra_rmn.adaptive_polling import create_adaptive_poller, get_data_staleness, update_adaptive_poller
+from ispra_rmn.level_state import read_level_state
+from led_panel.frame_pacing import create_frame_pacer, get_frame_jitter, wait_for_next_frame
+from led_panel.led_panel_drawings import (create_frame_bank, create_panel_engine, get_device_in_default_configuration, render_panel_engine,
+                                         set_panel_level)
+from metrics import enable_metrics, increment_counter, log_metrics_periodically, serve_metrics, set_gauge, timed, timed_serial
 
-# Tide gauge geographical reference.
-here = 'Bari'
+# Tide gauge geographical references, one per 8X8 block of the cascaded LED panel (from left to right).
+stations = ['Bari']
 
-# LED panel resolution.
+# LED panel resolution (of each block).
 dots = 8
 
-# Hydrometric level queue.
+# Hydrometric level queue, of (tide gauge geographical reference, level) pairs.
 level_queue = Queue()
 
-# Gets and enqueues the hydrometric level value.
+# Shutdown event, set on SIGINT and SIGTERM.
+shutdown = Event()
+
+# ISPRA sampling period (in seconds).
+sampling_period = 60*10
+
+# LED panel frame rate (in frames per second).
+fps = 2
+
+# Ingest isolation: if true, the hydrometric level is ingested and discretized in a worker process (forked at
+# startup), so that the pandas work does not stall the drawing; only the levels come back, over a pipe.
+isolated_ingest = False
+
+# Metrics: the port of the local Prometheus-style text endpoint, and the period (in seconds) of the JSON log line;
+# instrumentation is disabled if both are None.
+metrics_port = None
+metrics_log_period = None
+
+# Gets and enqueues the hydrometric level values of many tide gauges, polling each one on its own schedule.
 #
 # Args:
-# here: the tide gauge geographical reference.
+# stations: the tide gauge geographical references.
 # dots: the LED panel resolution.
-# level_queue: the queue of hydrometric level values.
-def get_hydrometric_level_nearby(here, dots, level_queue):
+# put_level: the function enqueuing a (tide gauge geographical reference, level) pair.
+# stop: the event stopping the polling.
+def get_hydrometric_level_nearby(stations, dots, put_level, stop):
+
+    logger = logging.getLogger(__name__)
+
+    # Deferred import: pandas and SPARQLWrapper are only imported on the first refresh, after the LED panel has shown
+    # the last known levels.
+    from ispra_rmn.ispra_rmn_services import get_discretized_hydrometric_level_nearby, get_latest_sample_time_nearby
 
     cuts = dots
 
-    while True:
-        level = get_discretized_hydrometric_level_nearby(here, cuts)
-        level_queue.put(level)
-        time.sleep(60*10) # TODO 60*5
+    # Poll each tide gauge just after the expected publishing of its new samples.
+    pollers = {here: create_adaptive_poller(sampling_period) for here in stations}
+    next_polls = {here: time.time() for here in stations}
+
+    while not stop.is_set():
+        for here in stations:
+            if next_polls[here] > time.time():
+                continue
+            try:
+                level = get_discretized_hydrometric_level_nearby(here, cuts, incremental=True)
+                put_level((here, level))
+            except Exception as error:
+                logger.error('Cannot get the hydrometric level near ' + here + ': ' + str(error))
+            poller = pollers[here]
+            next_polls[here] = time.time() + update_adaptive_poller(poller, time.time(), get_latest_sample_time_nearby(here))
+            staleness = get_data_staleness(poller, time.time())
+            if staleness is not None:
+                logger.info('Data staleness near ' + here + ': ' + str(int(staleness)) + ' s.')
+
+        # Export the data staleness of the stalest tide gauge.
+        stalenesses = [get_data_staleness(poller, time.time()) for poller in pollers.values()]
+        if any(staleness is not None for staleness in stalenesses):
+            set_gauge('data_staleness_seconds', max(staleness for staleness in stalenesses if staleness is not None))
+        stop.wait(max(min(next_polls.values()) - time.time(), 0))
+
+# Gets and sends the hydrometric level values over a pipe, in a worker process.
+#
+# Args:
+# stations: the tide gauge geographical references.
+# dots: the LED panel resolution.
+# connection: the sending end of the pipe.
+# stop: the event stopping the worker process.
+def get_hydrometric_level_in_worker_process(stations, dots, connection, stop):
+
+    # The main process handles SIGINT, and stops the worker process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    get_hydrometric_level_nearby(stations, dots, connection.send, stop)
+
+# Receives the hydrometric level values from the worker process, and enqueues them.
+#
+# Args:
+# connection: the receiving end of the pipe.
+# level_queue: the queue of hydrometric level values.
+def relay_hydrometric_level(connection, level_queue):
+
+    logger = logging.getLogger(__name__)
+
+    while not shutdown.is_set():
+        try:
+            if connection.poll(1):
+                level_queue.put(connection.recv())
+        except EOFError:
+            if not shutdown.is_set():
+                logger.error('The ingest worker process has stopped.')
+            break
 
-# Dequeues and draws the hydrometric level value.
+# Dequeues and draws the hydrometric level values, one 8X8 block per tide gauge.
 #
 # Args:
 # level_queue: the queue of hydrometric level values.
 def draw_hydrometric_level(level_queue):
 
-    device = get_device_in_default_configuration()
+    logger = logging.getLogger(__name__)
+
+    device = get_device_in_default_configuration(timed_serial, cascaded=len(stations))
+    engine = create_panel_engine(device, stations, create_frame_bank(matrix_dimension=dots))
+
+    # Show the last known levels at once, until the first refresh.
+    for here, level in read_level_state(stations, dots).items():
+        set_panel_level(engine, here, level)
+
+    # Pace frames by deadline, waiting on the shutdown event instead of sleeping.
+    pacer = create_frame_pacer(fps)
+
+    frames = 0
+    while not shutdown.is_set():
+        # Pick up the new levels, without waiting, then draw all the blocks at once.
+        set_gauge('level_queue_depth', level_queue.qsize())
+        try:
+            while True:
+                here, level = level_queue.get_nowait()
+                set_panel_level(engine, here, level)
+        except Empty:
+            pass
 
-    level = 0
-    while True:
-        if not level_queue.empty():
-            level= level_queue.get()
-        if level > 0:
-            draw_level(device, level)
+        # Frame draw time: compose, encode and SPI write time (see spi_write_seconds).
+        with timed('frame_draw_seconds'):
+            render_panel_engine(engine)
+        increment_counter('frames_total')
+        wait_for_next_frame(pacer, shutdown.wait)
+        frames += 1
+        if frames % (60*fps) == 0:
+            logger.debug('Frame jitter: ' + str(get_frame_jitter(pacer)))
+
+    device.clear()
+
+# Sets the shutdown event.
+#
+# Args:
+# signal_number: the signal number.
+# frame: the current stack frame.
+def request_shutdown(signal_number, frame):
+
+    logging.getLogger(__name__).info('Shutting down (signal ' + str(signal_number) + ')...')
+    shutdown.set()
 
 # Configure logging.
 logging.basicConfig()
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Thread the ingesting and enqueuing of the hydrometric level.
-thread_get_hydrometric_level_nearby = Thread(target = get_hydrometric_level_nearby, args = (here, dots, level_queue, ))
-thread_get_hydrometric_level_nearby.setDaemon(True)
+# Fork the ingest worker process, if isolated, before starting any thread.
+if isolated_ingest:
+    context = multiprocessing.get_context('fork')
+    stop_worker = context.Event()
+    receiver, sender = context.Pipe(duplex=False)
+    worker = context.Process(target = get_hydrometric_level_in_worker_process, args = (stations, dots, sender, stop_worker, ))
+    worker.daemon = True
+    worker.start()
+    sender.close()
+
+# Export metrics, if enabled (in the main process only).
+if metrics_port is not None or metrics_log_period is not None:
+    enable_metrics()
+if metrics_port is not None:
+    serve_metrics(metrics_port)
+if metrics_log_period is not None:
+    log_metrics_periodically(metrics_log_period, shutdown)
+
+# Shut down cleanly on SIGINT and SIGTERM.
+signal.signal(signal.SIGINT, request_shutdown)
+signal.signal(signal.SIGTERM, request_shutdown)
+
+# Thread the ingesting and enqueuing of the hydrometric level, or the relaying of it from the worker process.
+if isolated_ingest:
+    thread_get_hydrometric_level_nearby = Thread(target = relay_hydrometric_level, args = (receiver, level_queue, ))
+else:
+    thread_get_hydrometric_level_nearby = Thread(target = get_hydrometric_level_nearby, args = (stations, dots, level_queue.put, shutdown, ))
+thread_get_hydrometric_level_nearby.daemon = True
 thread_get_hydrometric_level_nearby.start()
 
 # Thread the dequeuing and drawing of the hydrometric level.
 thread_draw_hydrometric_level = Thread(target = draw_hydrometric_level, args = (level_queue, ))
-thread_draw_hydrometric_level.setDaemon(True)
+thread_draw_hydrometric_level.daemon = True
 thread_draw_hydrometric_level.start()
 
-while True:
-    pass
+# Wait (idle) for the shutdown, then for the drawing (and the worker process) to stop.
+shutdown.wait()
+thread_draw_hydrometric_level.join(timeout=5)
+if isolated_ingest:
+    stop_worker.set()
+    worker.join(timeout=5)
 
 # --------------------------------------------------
\ No newline at end of file